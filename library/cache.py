@@ -0,0 +1,130 @@
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class LRUCache(object):
+    __doc__ = """Thread safe in-process LRU cache, entries expire
+    `ttl` seconds after they were stored"""
+
+    def __init__(self, maxsize=128, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TwoTierCache(object):
+    __doc__ = """In-process LRU in front of a Django cache backend.
+    Keys are expected to be versioned, so a local entry is never
+    served after the shared version moved on. With `cross_process`, the
+    shared tier is skipped when the backend is itself per process, a
+    delete there would not reach the other workers."""
+
+    def __init__(self, alias='default', maxsize=128, ttl=30, timeout=300,
+            cross_process=False):
+        self.alias = alias
+        self.timeout = timeout
+        self.cross_process = cross_process
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    @property
+    def shared(self):
+        backend = caches[self.alias]
+        if self.cross_process and isinstance(backend, LocMemCache):
+            return None
+        return backend
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+
+def _version_key(namespace):
+    return 'version:{0}'.format(namespace)
+
+
+def _new_version():
+    # the second it took effect, rounded up, rides along for Last-Modified
+    return '{0}-{1}'.format(uuid.uuid4().hex, math.ceil(time.time()))
+
+
+def get_version(namespace):
+    """Current version token of a cache namespace."""
+    shared = caches['default']
+    version = shared.get(_version_key(namespace))
+    if version is None:
+        shared.add(_version_key(namespace), _new_version(), None)
+        version = shared.get(_version_key(namespace))
+    return version
+
+
+def version_time(namespace):
+    """Unix time of the last bump of a namespace."""
+    version = get_version(namespace)
+    return int(version.rsplit('-', 1)[1]) if '-' in version else 0
+
+
+def bump_version(namespace):
+    """Invalidate every key of a namespace. A random token, unlike a
+    counter, cannot come back to an old value after an eviction."""
+    caches['default'].set(_version_key(namespace), _new_version(), None)
+
+
+def versioned_key(namespace, *parts):
+    digest = md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return '{0}:{1}:{2}'.format(namespace, get_version(namespace), digest)
+
+
+response_cache = TwoTierCache(
+    maxsize=settings.RESPONSE_CACHE_LOCAL_SIZE,
+    ttl=settings.RESPONSE_CACHE_LOCAL_TTL,
+    timeout=settings.RESPONSE_CACHE_TIMEOUT)
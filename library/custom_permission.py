@@ -8,4 +8,11 @@ class APIPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.is_superuser or request.method=='GET':
             return True
-        return False
\ No newline at end of file
+        return False
+
+
+class SuperUserPermission(permissions.BasePermission):
+    __doc__ = """Superusers only, e.g. exports of reader data"""
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
@@ -1,15 +1,71 @@
 from rest_framework import pagination
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.db.models import QuerySet
+
+
+class CursorResultsSetPagination(CursorPagination):
+    __doc__ = """Keyset pagination, pages are found through an index
+    seek on the ordering field instead of an OFFSET scan"""
+
+    page_size = settings.PAGINATION_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    # `updated` and `created` are not unique, `id` keeps the order stable
+    # between ties. Views pick their default with an `ordering` attribute
+    orderings = {
+        '-id': ('-id',),
+        'updated': ('updated', 'id'),
+        '-updated': ('-updated', '-id'),
+        '-created': ('-created', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        default = self.orderings[getattr(view, 'ordering', '-id')]
+        return self.orderings.get(ordering, default)
+
+    def decode_cursor(self, request):
+        # an empty cursor opts into cursor mode and starts at the top
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
 
 
 class CustomResultsSetPagination(PageNumberPagination):
     page_size = settings.PAGINATION_PAGE_SIZE
     page_size_query_param = 'page_size'
-    
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    cursor_pagination_class = CursorResultsSetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        # ranked results, e.g. search hits, can only be paged by number
+        if (self.cursor_query_param not in request.query_params
+                or not isinstance(queryset, QuerySet)):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_pagination = self.cursor_pagination_class()
+        self.total_records = None
+        if request.query_params.get(self.count_query_param) in ('true', '1'):
+            self.total_records = queryset.count()
+        return self.cursor_pagination.paginate_queryset(
+            queryset, request, view)
+
     def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return Response({
+                'data': data,
+                'meta': {
+                    "totalRecords": self.total_records,
+                    "page-size": self.cursor_pagination.page_size,
+                    "next": self.cursor_pagination.get_next_link(),
+                    "previous": self.cursor_pagination.get_previous_link(),
+                },
+            })
 
         return Response({
             'data': data,
@@ -19,4 +75,4 @@ class CustomResultsSetPagination(PageNumberPagination):
                 "next": self.get_next_link(),
                 "previous": self.get_previous_link(),
             },
-        })
\ No newline at end of file
+        })
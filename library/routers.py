@@ -0,0 +1,97 @@
+import random
+import threading
+from contextlib import contextmanager
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# accounts, tokens and sessions are read right after they are written by
+# requests that carry no identity yet, login and signup, never a replica
+PRIMARY_APPS = ('auth', 'authtoken', 'sessions', 'users')
+
+_state = threading.local()
+
+
+def request_replica():
+    """Replica alias the current request reads from, None for default."""
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def primary_reads():
+    """Reads inside the block go to default. For what outlives the
+    request, e.g. shared cache entries and their validators: a lagging
+    replica would have them served to every client."""
+    replica, _state.replica = request_replica(), None
+    try:
+        yield
+    finally:
+        _state.replica = replica
+
+
+class ReplicaRouter(object):
+    __doc__ = """Reads of safe-method requests go to the replica
+    ReplicaMiddleware picked for the request, everything else and the
+    PRIMARY_APPS to default. Outside ReplicaMiddleware, in commands and
+    tasks, nothing is routed."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return 'default'
+        return request_replica() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas are copies of default
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def _sticky_key(request):
+    """Cache key of the client behind `request`, its token or session."""
+    identity = (request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not identity:
+        return None
+    return 'replica-sticky:{0}'.format(md5(identity.encode()).hexdigest())
+
+
+class ReplicaMiddleware(object):
+    __doc__ = """Picks one replica for each safe-method request, so all
+    of its reads see the same copy. A client that wrote reads from
+    default for REPLICA_STICKY_SECONDS afterwards, long enough for the
+    replicas to catch up, so it sees its own writes. The marker lives in
+    the shared cache, with a per-process backend the other workers would
+    not see it and nothing is routed."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def replica(self, request, key):
+        if (not settings.DATABASE_REPLICAS
+                or request.method not in SAFE_METHODS
+                or isinstance(caches['default'], LocMemCache)
+                or (key and caches['default'].get(key))):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def __call__(self, request):
+        key = _sticky_key(request)
+        _state.replica = self.replica(request, key)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = None
+        if request.method not in SAFE_METHODS and key:
+            caches['default'].set(
+                key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
@@ -65,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library.routers.ReplicaMiddleware',
 ]
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -101,11 +102,45 @@ WSGI_APPLICATION = 'library.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': 'library.sqlite3',
+        # db.sqlite3 is the shared development data, deployments point
+        # DATABASE_PATH at their own file
+        'NAME': os.environ.get('DATABASE_PATH',
+            os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
     }
 }
 
+# applied on connect by the library.sqlite3 backend. WAL lets readers run
+# during a write, busy_timeout makes writers queue instead of failing with
+# "database is locked", cache_size is in KiB when negative
+SQLITE_PRAGMAS = {
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,
+}
+# journal_mode is written into the file header, merely opening the tracked
+# db.sqlite3 would change it. Only a DATABASE_PATH database gets WAL
+if os.environ.get('DATABASE_PATH'):
+    SQLITE_PRAGMAS['journal_mode'] = 'wal'
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+# read replicas, comma separated SQLite files refreshed from default by the
+# refresh_replica command. Safe-method requests read from them, except the
+# account and token tables, and only with a shared cache backend
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None,
+        os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    alias = 'replica{0}'.format(number)
+    # read only, nothing to take the write lock for
+    DATABASES[alias] = dict(DATABASES['default'], NAME=path,
+        TRANSACTION_MODE='DEFERRED', TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['library.routers.ReplicaRouter']
+# reads of a client go to default for this long after it wrote
+REPLICA_STICKY_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,6 +184,30 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# content addressed media (MEDIA_URL cas/) never changes, the front
+# proxy should send the same header
+CAS_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# unreferenced blobs younger than this are kept by gc_blobs, they may
+# belong to a transaction still running
+CAS_GC_GRACE_HOURS = 24
+
+# 'django' streams book files itself, 'x-accel-redirect' (nginx) and
+# 'x-sendfile' (apache, lighttpd) let the front proxy send them
+BOOK_DOWNLOAD_MODE = os.environ.get('BOOK_DOWNLOAD_MODE', 'django')
+# internal nginx location aliased to MEDIA_ROOT
+BOOK_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# cover thumbnails, every size is encoded in every format
+COVER_THUMBNAIL_SIZES = {
+    'small': (120, 180),
+    'medium': (240, 360),
+    'large': (480, 720),
+}
+COVER_THUMBNAIL_FORMATS = ('webp', 'jpeg')
+COVER_THUMBNAIL_QUALITY = 80
+
+# partial chunked uploads, outside the served media
+BOOK_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
 
 
 #====================================
@@ -160,6 +219,15 @@ EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+# queued mail is sent in batches over one connection, MAIL_BATCH_DELAY
+# seconds after the first message of a burst
+MAIL_BATCH_SIZE = 100
+MAIL_BATCH_DELAY = 5
+# a claim this old belongs to a sender that died, its messages are queued
+# again. Longer than a batch takes to send, or they go out twice
+MAIL_CLAIM_TIMEOUT = 60 * 10
+# Site the links in emails point to
+MAIL_SITE_NAME = 'development'
 
 
 REST_FRAMEWORK = {
@@ -168,9 +236,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -188,10 +254,52 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
 
 
+#====================================
+''' Cache Configuration Settings '''
+#====================================
+# the response cache versions, token entries and sticky reads live here,
+# every web and Celery process must see the same backend: files on one
+# host, memcached across hosts (CACHE_BACKEND=django.core.cache.backends.
+# memcached.MemcachedCache, CACHE_LOCATION=host:port). LocMemCache is per
+# process, invalidations would not reach the other workers
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION',
+            os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+# tests get a private in-process cache instead
+TEST_RUNNER = 'library.test_runner.TestRunner'
+
+# catalog, author and category reads
+RESPONSE_CACHE_TIMEOUT = 60 * 15
+RESPONSE_CACHE_LOCAL_SIZE = 512
+RESPONSE_CACHE_LOCAL_TTL = 30
+
+# resolved API tokens. A logout deletes the shared entry, the copies of
+# other processes expire after the local ttl. With a per-process backend
+# (LocMemCache) only the local tier is used, the shared timeout would
+# let other workers accept a logged-out token for that long
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 15
+AUTH_TOKEN_CACHE_LOCAL_SIZE = 1024
+AUTH_TOKEN_CACHE_LOCAL_TTL = 10
+
+# reading progress heartbeats, written behind in bulk
+PROGRESS_BUFFER_SIZE = 500
+PROGRESS_FLUSH_INTERVAL = 5
+# items accepted by one offline sync request
+PROGRESS_SYNC_LIMIT = 1000
+
+
 #====================================
 ''' Pagination Configuration Settings '''
 #====================================
 PAGINATION_PAGE_SIZE = 10
+# reviews embedded in a book, the rest is paginated
+BOOK_LATEST_REVIEWS = 5
 #====================================
 
 
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    __doc__ = """The SQLite backend, tuned for concurrent requests.
+
+    Every new connection runs settings.SQLITE_PRAGMAS, and transactions
+    begin with settings.SQLITE_TRANSACTION_MODE, or the TRANSACTION_MODE
+    of the alias. IMMEDIATE takes the write lock up front: a deferred
+    transaction that read first fails with "database is locked" when it
+    tries to write, without waiting for busy_timeout."""
+
+    def init_connection_state(self):
+        super().init_connection_state()
+        # straight to the driver, query logs and counts do not see them
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            self.connection.execute('PRAGMA {0} = {1}'.format(name, value))
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN {0}'.format(
+            self.settings_dict.get('TRANSACTION_MODE')
+            or settings.SQLITE_TRANSACTION_MODE))
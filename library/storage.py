@@ -0,0 +1,57 @@
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.views.static import serve
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    __doc__ = """Files stored under the sha256 of their content, the same
+    content is kept once whatever name it was uploaded with. Names never
+    change content, so their URLs can be cached forever."""
+
+    prefix = 'cas'
+
+    def hashed_name(self, digest, extension=''):
+        return '{0}/{1}/{2}/{3}{4}'.format(self.prefix,
+            digest[:2], digest[2:4], digest, extension.lower())
+
+    def is_hashed_name(self, name):
+        return bool(name) and name.startswith(self.prefix + '/')
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        hasher = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        name = self.hashed_name(
+            hasher.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(name):
+            return name
+
+        # written aside then renamed, concurrent saves of the same
+        # content both end with the complete file in place
+        partial = '{0}.{1}.part'.format(name, uuid.uuid4().hex)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        partial = super()._save(partial, content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+
+cas_storage = ContentAddressedStorage()
+
+
+def serve_immutable(request, path, document_root=None):
+    """django.views.static.serve for content addressed media."""
+    response = serve(request, path, document_root)
+    response['Cache-Control'] = settings.CAS_CACHE_CONTROL
+    return response
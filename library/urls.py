@@ -13,8 +13,10 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.conf.urls import include
 from django.contrib import admin
 from django.conf.urls.static import static
@@ -25,6 +27,7 @@ from rest_framework.authtoken import views
 
 from users import views as user_views
 from management import views as mgm_views
+from library.storage import cas_storage, serve_immutable
 
 
 router = routers.SimpleRouter()
@@ -34,6 +37,9 @@ router.register(r'book-catalog', mgm_views.BookCatalogViewSet)
 router.register(r'author', mgm_views.AuthorViewSet)
 router.register(r'review', mgm_views.ReviewViewSet, basename='review')
 router.register(r'track-readed-books', mgm_views.ReadersTrackerViewSet)
+router.register(r'book-uploads', mgm_views.BookUploadViewSet)
+router.register(r'my-library', mgm_views.MyLibraryViewSet,
+    basename='my-library')
 
 urlpatterns = [
     path('api/admin/', admin.site.urls),
@@ -57,4 +63,12 @@ urlpatterns = [
     path('api/update-password/', user_views.UpdatePassword.as_view(),
         name='update_password'),
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
+
+if settings.DEBUG:
+    # served before static() below, with the long lived cache headers
+    urlpatterns.append(re_path(r'^{0}{1}/(?P<path>.*)$'.format(
+        settings.MEDIA_URL.lstrip('/'), cas_storage.prefix), serve_immutable,
+        {'document_root': os.path.join(settings.MEDIA_ROOT, cas_storage.prefix)}))
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,281 @@
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from faker import Faker
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.cache import bump_version
+from .management.commands.import_catalog import insert_rows
+from .models import (Category, Author, BookCatalog, Review, ReadersTracker,
+    BookStats)
+from .signals import CATALOG_CACHE
+from . import stats
+
+
+BENCHMARK_PASSWORD = 'benchmark'
+INSERT_BATCH = 50000
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def seed_books(fake, rng, books, authors, categories):
+    """Books go through import_catalog, which keeps the stats and the
+    search index as the signals would."""
+    author_names = [fake.name() for _ in range(authors)]
+    category_names = ['{0} {1}'.format(fake.word().title(), number)
+        for number in range(categories)]
+    handle, path = tempfile.mkstemp(suffix='.jsonl')
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as output:
+            for _ in range(books):
+                output.write(json.dumps({
+                    'name': fake.sentence(nb_words=4)[:-1],
+                    'category': rng.choice(category_names),
+                    'authors': rng.sample(author_names, rng.randint(1, 3)),
+                    'description': fake.paragraph(nb_sentences=2),
+                }) + '\n')
+        call_command('import_catalog', path, stdout=io.StringIO())
+    finally:
+        os.remove(path)
+
+
+def seed_readers(readers):
+    """Readers share one password hash, hashing each would take hours."""
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(User(username='reader{0}'.format(number),
+        email='reader{0}@example.com'.format(number), password=password)
+        for number in range(readers))
+    Token.objects.bulk_create(Token(key=Token().generate_key(), user_id=pk)
+        for pk in User.objects.values_list('pk', flat=True))
+
+
+def _insert_with_stats(model, columns, rows, book_counters):
+    with transaction.atomic():
+        insert_rows(model, columns, rows)
+        for name, counts in book_counters.items():
+            stats.increment_many(BookStats, name, counts)
+
+
+def seed_trackers(rng, trackers, first_book, last_book, reader_ids):
+    """At most one tracker per reader and book, as the constraint wants."""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    columns = ('book_id', 'reader_id', 'percent', 'created', 'updated')
+    per_reader, extra = divmod(trackers, len(reader_ids))
+    books = range(first_book, last_book + 1)
+    rows, readers, completed = [], Counter(), Counter()
+    for index, reader_id in enumerate(reader_ids):
+        count = min(per_reader + int(index < extra), len(books))
+        for book_id in rng.sample(books, count):
+            percent = 100 if rng.random() < 0.2 else rng.randint(0, 99)
+            rows.append((book_id, reader_id, percent, now, now))
+            readers[book_id] += 1
+            completed[book_id] += int(percent == 100)
+        if len(rows) >= INSERT_BATCH or index == len(reader_ids) - 1:
+            _insert_with_stats(ReadersTracker, columns, rows, {
+                'reader_count': readers, 'completed_count': completed})
+            rows, readers, completed = [], Counter(), Counter()
+
+
+def seed_reviews(fake, rng, reviews, first_book, last_book, reader_ids):
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    columns = ('book_id', 'reader_id', 'review', 'created', 'updated')
+    rows, counts = [], Counter()
+    for number in range(reviews):
+        book_id = rng.randint(first_book, last_book)
+        rows.append((book_id, rng.choice(reader_ids),
+            fake.sentence()[:100], now, now))
+        counts[book_id] += 1
+        if len(rows) >= INSERT_BATCH or number == reviews - 1:
+            _insert_with_stats(Review, columns, rows,
+                {'review_count': counts})
+            rows, counts = [], Counter()
+
+
+def seed(books, authors, categories, readers, trackers, reviews, seed=0):
+    """Fill an empty database with a reproducible Faker dataset."""
+    fake = Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    seed_books(fake, rng, books, authors, categories)
+    seed_readers(readers)
+    bounds = BookCatalog.objects.aggregate(first=Min('id'), last=Max('id'))
+    reader_ids = list(User.objects.values_list('pk', flat=True))
+    seed_trackers(rng, trackers, bounds['first'], bounds['last'], reader_ids)
+    seed_reviews(fake, rng, reviews, bounds['first'], bounds['last'],
+        reader_ids)
+    bump_version(CATALOG_CACHE)
+
+
+def dataset():
+    """Row counts of what the requests run against."""
+    return {model._meta.model_name: model.objects.count() for model in
+        (BookCatalog, Author, Category, User, ReadersTracker, Review)}
+
+
+class Workload(object):
+    __doc__ = """The ids the scenarios pick from, loaded once."""
+
+    def __init__(self):
+        bounds = BookCatalog.objects.aggregate(
+            first=Min('id'), last=Max('id'))
+        self.first_book, self.last_book = bounds['first'], bounds['last']
+        self.authors = list(Author.objects.values_list('pk', flat=True))
+        self.categories = list(Category.objects.values_list('pk', flat=True))
+        self.readers = list(Token.objects.values_list(
+            'user_id', 'user__username', 'key'))
+
+    def book(self, rng):
+        return rng.randint(self.first_book, self.last_book)
+
+
+def book_list(client, workload, reader, rng):
+    return client.get('/api/book-catalog/', {'page_size': 20})
+
+
+def book_detail(client, workload, reader, rng):
+    return client.get('/api/book-catalog/{0}/'.format(workload.book(rng)))
+
+
+def author_books(client, workload, reader, rng):
+    return client.get('/api/author/books/{0}/'.format(
+        rng.choice(workload.authors)))
+
+
+def category_books(client, workload, reader, rng):
+    return client.get('/api/category/books/{0}/'.format(
+        rng.choice(workload.categories)))
+
+
+def review(client, workload, reader, rng):
+    return client.post('/api/review/', {'book': workload.book(rng),
+        'reader': reader[0], 'review': 'benchmark'}, format='json')
+
+
+def track(client, workload, reader, rng):
+    return client.post('/api/track-readed-books/', {
+        'book': workload.book(rng), 'reader': reader[0],
+        'percent': rng.randint(0, 100)}, format='json')
+
+
+def login(client, workload, reader, rng):
+    return client.post('/api/login-user/', {'email_or_username': reader[1],
+        'password': BENCHMARK_PASSWORD}, format='json')
+
+
+# name: (weight, scenario), a read-heavy mix
+SCENARIOS = {
+    'book_list': (30, book_list),
+    'book_detail': (30, book_detail),
+    'author_books': (10, author_books),
+    'category_books': (5, category_books),
+    'review': (5, review),
+    'track': (15, track),
+    'login': (5, login),
+}
+
+
+def _client(workload, rng):
+    reader = rng.choice(workload.readers)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + reader[2])
+    return client, reader
+
+
+def _send(scenario, client, workload, reader, rng):
+    """Status code of the response. The test client raises what the view
+    raised, that counts as a 500."""
+    try:
+        return scenario(client, workload, reader, rng).status_code
+    except Exception:
+        return 500
+
+
+def _worker(number, requests, warmup, workload, scenarios, seed, samples,
+        start):
+    rng = random.Random(seed + number)
+    names = list(scenarios)
+    weights = [scenarios[name][0] for name in names]
+    client, reader = _client(workload, rng)
+    try:
+        for _ in range(warmup):
+            _send(scenarios[rng.choices(names, weights)[0]][1],
+                client, workload, reader, rng)
+        start.wait()
+        for _ in range(requests):
+            name = rng.choices(names, weights)[0]
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                status = _send(scenarios[name][1],
+                    client, workload, reader, rng)
+                elapsed = time.perf_counter() - started
+            # list.append is atomic, the threads share `samples`
+            samples[name].append((elapsed * 1000, len(queries),
+                status >= 400))
+    finally:
+        connection.close()
+
+
+def _summary(samples):
+    latencies = [sample[0] for sample in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(sample[2] for sample in samples),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'mean': round(sum(latencies) / len(latencies), 2),
+        },
+        'queries_per_request': round(
+            sum(sample[1] for sample in samples) / len(samples), 2),
+    }
+
+
+def run(threads=4, requests=1000, warmup=20, scenarios=None, seed=0):
+    """Send `requests` requests from each of `threads` in-process clients,
+    returns the report. Warmup requests fill the caches and are not
+    counted."""
+    scenarios = scenarios or SCENARIOS
+    workload = Workload()
+    connection.close()
+    samples = {name: [] for name in scenarios}
+    # the clock starts once every thread is warm
+    start = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_worker, args=(number, requests,
+        warmup, workload, scenarios, seed, samples, start))
+        for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    every = [sample for values in samples.values() for sample in values]
+    return {
+        'threads': threads,
+        'seconds': round(elapsed, 2),
+        'throughput': round(len(every) / elapsed, 1),
+        'overall': _summary(every),
+        'endpoints': {name: _summary(values)
+            for name, values in sorted(samples.items()) if values},
+    }
@@ -0,0 +1,82 @@
+import datetime
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from library.storage import cas_storage
+from .models import BookCatalog, StoredBlob
+
+
+BLOB_FIELDS = ('file', 'book_cover')
+
+
+def reference(name, delta):
+    """Add `delta` references to a content addressed file."""
+    if not delta or not cas_storage.is_hashed_name(name):
+        return
+    updated = StoredBlob.objects.filter(name=name).update(
+        references=F('references') + delta, updated=timezone.now())
+    if not updated:
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(name=name, references=delta)
+        except IntegrityError:
+            reference(name, delta)
+
+
+def recount():
+    """Rebuild every reference count from the book columns. Returns the
+    number of rows that drifted."""
+    expected = Counter()
+    for names in BookCatalog.objects.values_list(*BLOB_FIELDS).iterator():
+        expected.update(name for name in names
+            if cas_storage.is_hashed_name(name))
+
+    drifted = 0
+    current = dict(StoredBlob.objects.values_list('name', 'references'))
+    with transaction.atomic():
+        for name in set(current) | set(expected):
+            if current.get(name) != expected[name]:
+                reference(name, expected[name] - current.get(name, 0))
+                drifted += 1
+    return drifted
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """Delete the files nothing refers to anymore, unless touched within
+    the `grace` timedelta: unreferenced counters, and files without a
+    counter, left by transactions that rolled back. Returns the names."""
+    if grace is None:
+        grace = datetime.timedelta(hours=settings.CAS_GC_GRACE_HOURS)
+    cutoff = timezone.now() - grace
+    removed = []
+
+    unreferenced = StoredBlob.objects.filter(
+        references__lte=0, updated__lt=cutoff)
+    for name in unreferenced.values_list('name', flat=True).iterator():
+        if not dry_run:
+            # a reference added meanwhile keeps the row, and the file
+            if not StoredBlob.objects.filter(
+                    name=name, references__lte=0).delete()[0]:
+                continue
+            cas_storage.delete(name)
+        removed.append(name)
+
+    root = cas_storage.path(cas_storage.prefix)
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    for directory, subdirectories, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, cas_storage.location).replace(
+                os.sep, '/')
+            if (name in known or name in removed
+                    or os.path.getmtime(path) > cutoff.timestamp()):
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(name)
+    return removed
@@ -0,0 +1,112 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+    HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def requested_range(header, size):
+    """(start, end) inclusive of a single `bytes=` range, None to send the
+    whole file (no or multiple ranges), False if it is not satisfiable."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end or not int(end):
+            return False
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as stream:
+        stream.seek(start)
+        while length > 0:
+            chunk = stream.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def proxied_response(field_file, path, content_type):
+    """Empty response handing the transfer, ranges included, to the
+    front proxy."""
+    response = HttpResponse(content_type=content_type)
+    if settings.BOOK_DOWNLOAD_MODE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(
+            settings.BOOK_DOWNLOAD_ACCEL_PREFIX + field_file.name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def file_response(request, field_file, filename=None):
+    """Serve a stored file with Range, If-Range and conditional GET
+    support. Whole files go through FileResponse, which the WSGI server
+    can send with sendfile; ranges are streamed in chunks."""
+    try:
+        path = field_file.path
+    except (ValueError, SuspiciousFileOperation):
+        raise Http404('No file.')
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404('No file.')
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = quote_etag('{0:x}-{1:x}'.format(int(stat.st_mtime), stat.st_size))
+    last_modified = http_date(stat.st_mtime)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if (etag == if_none_match or if_none_match is None
+            and if_modified_since and int(stat.st_mtime) <= if_modified_since):
+        response = HttpResponseNotModified()
+    elif settings.BOOK_DOWNLOAD_MODE != 'django':
+        response = proxied_response(field_file, path, content_type)
+    else:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range in (etag, last_modified):
+            byte_range = requested_range(
+                request.META.get('HTTP_RANGE', ''), stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{0}'.format(stat.st_size)
+        elif byte_range is None:
+            response = FileResponse(open(path, 'rb'),
+                content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(path, start, end - start + 1),
+                status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, stat.st_size)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = 'inline; filename="{0}"'.format(
+            filename or os.path.basename(path))
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,106 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework.exceptions import ValidationError
+
+from .filters import _timestamp
+from .models import BookCatalog, ReadersTracker
+
+
+EXPORT_CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _keyset_chunks(queryset, fields, chunk_size):
+    """Rows in id order, `chunk_size` at a time. Each chunk seeks past
+    the last id on the primary key, so memory stays flat and no cursor
+    is held open between chunks."""
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = list(chunk.values(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+def book_rows(queryset, chunk_size):
+    """Books as import_catalog reads them, authors by name."""
+    fields = ('id', 'name', 'category__name', 'description',
+        'created', 'updated')
+    for rows in _keyset_chunks(queryset, fields, chunk_size):
+        authors = defaultdict(list)
+        links = BookCatalog.author.through.objects.filter(
+            bookcatalog_id__in=[row['id'] for row in rows]).order_by('id')
+        for book_id, name in links.values_list(
+                'bookcatalog_id', 'author__name'):
+            authors[book_id].append(name)
+        for row in rows:
+            row['category'] = row.pop('category__name')
+            row['authors'] = authors[row['id']]
+            yield row
+
+
+def tracker_rows(queryset, chunk_size):
+    fields = ('id', 'book_id', 'reader_id', 'percent', 'created', 'updated')
+    for rows in _keyset_chunks(queryset, fields, chunk_size):
+        yield from rows
+
+
+EXPORTS = {
+    'books': (BookCatalog.objects.all, book_rows,
+        ('id', 'name', 'category', 'authors', 'description', 'created',
+        'updated')),
+    'trackers': (ReadersTracker.objects.all, tracker_rows,
+        ('id', 'book_id', 'reader_id', 'percent', 'created', 'updated')),
+}
+
+
+class _Echo(object):
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows, columns):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(['|'.join(row[column])
+            if isinstance(row[column], list) else row[column]
+            for column in columns])
+
+
+WRITERS = {'ndjson': ndjson_lines, 'csv': csv_lines}
+
+
+def export_lines(name, output='ndjson', params=None,
+        chunk_size=EXPORT_CHUNK_SIZE):
+    """Lines of the `name` export, ?updated_after= &updated_before=
+    (exclusive) of `params` restrict it to a window of changes."""
+    if output not in WRITERS:
+        raise ValidationError({'output': 'Expected one of {0}.'.format(
+            ', '.join(sorted(WRITERS)))})
+    params = params or {}
+    queryset, rows, columns = EXPORTS[name]
+    queryset = queryset()
+    updated_after = _timestamp(params, 'updated_after')
+    if updated_after is not None:
+        queryset = queryset.filter(updated__gte=updated_after)
+    updated_before = _timestamp(params, 'updated_before')
+    if updated_before is not None:
+        queryset = queryset.filter(updated__lt=updated_before)
+    return WRITERS[output](rows(queryset, chunk_size), columns)
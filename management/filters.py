@@ -0,0 +1,97 @@
+import datetime
+
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import BookCatalog
+
+
+FACET_PARAMS = ('category', 'author')
+FILTER_PARAMS = FACET_PARAMS + ('created_after', 'created_before')
+FACET_LIMIT = 20
+
+
+def _id_list(params, name):
+    try:
+        return [int(value) for value in params.get(name, '').split(',')
+            if value.strip()]
+    except ValueError:
+        raise ValidationError({name: 'Expected comma separated ids.'})
+
+
+def _timestamp(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: 'Expected a date or datetime.'})
+        parsed = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_books(queryset, params, skip=None):
+    """Apply the catalog filters of `params`, except the `skip` one."""
+    categories = _id_list(params, 'category')
+    if categories and skip != 'category':
+        queryset = queryset.filter(category_id__in=categories)
+
+    authors = _id_list(params, 'author')
+    if authors and skip != 'author':
+        # a subquery, unlike author__in, cannot duplicate books
+        queryset = queryset.filter(
+            pk__in=BookCatalog.author.through.objects.filter(
+                author_id__in=authors).values('bookcatalog_id'))
+
+    created_after = _timestamp(params, 'created_after')
+    if created_after is not None:
+        queryset = queryset.filter(created__gte=created_after)
+    created_before = _timestamp(params, 'created_before')
+    if created_before is not None:
+        queryset = queryset.filter(created__lt=created_before)
+    return queryset
+
+
+def wants_facets(params):
+    return params.get('facets') in ('true', '1') or any(
+        name in params for name in FILTER_PARAMS)
+
+
+def book_facets(queryset, params):
+    """Book counts per category and per author (top FACET_LIMIT). Each
+    facet ignores its own filter, so the counts describe the choices the
+    client can still switch to. One GROUP BY query per facet."""
+    categories = filter_books(queryset, params, skip='category').order_by()
+    categories = categories.values('category_id', 'category__name').annotate(
+        count=Count('pk')).order_by('-count', 'category_id')
+
+    books = filter_books(queryset, params, skip='author').order_by()
+    authors = BookCatalog.author.through.objects.filter(
+        bookcatalog_id__in=books.values('pk')).values(
+        'author_id', 'author__name').annotate(
+        count=Count('bookcatalog_id')).order_by('-count', 'author_id')
+
+    return {
+        'category': [{'id': row['category_id'],
+            'name': row['category__name'], 'count': row['count']}
+            for row in categories],
+        'author': [{'id': row['author_id'],
+            'name': row['author__name'], 'count': row['count']}
+            for row in authors[:FACET_LIMIT]],
+    }
+
+
+class BookCatalogFilter(BaseFilterBackend):
+    __doc__ = """?category=1,2 &author=3,4 &created_after= &created_before=
+    (exclusive) on the book catalog, values of a parameter are OR-ed"""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_books(queryset, request.query_params)
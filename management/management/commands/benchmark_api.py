@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from management.benchmark import SCENARIOS, dataset, run, seed
+from management.models import BookCatalog
+
+
+class Command(BaseCommand):
+    help = ('Seed a Faker dataset into a throwaway SQLite file and drive '
+        'the API with concurrent in-process clients. Prints latency '
+        'percentiles, queries per request and throughput as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000)
+        parser.add_argument('--authors', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--readers', type=int, default=10000)
+        parser.add_argument('--trackers', type=int, default=10000000)
+        parser.add_argument('--reviews', type=int, default=100000)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=1000,
+            help='Measured requests per thread.')
+        parser.add_argument('--warmup', type=int, default=20,
+            help='Requests per thread before measuring.')
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+            help='Only these endpoints, all by default.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep-db',
+            help='Database file kept between runs, seeded when missing.')
+        parser.add_argument('--output', help='Write the report there too.')
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        old_name, old_test = settings_dict['NAME'], settings_dict['TEST']
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SQLITE_PRAGMAS=dict(
+                    settings.SQLITE_PRAGMAS, journal_mode='wal')):
+            # a file, so that WAL and the thread connections behave as
+            # they would in production
+            settings_dict['TEST'] = dict(old_test, NAME=options['keep_db']
+                or os.path.join(directory, 'benchmark.sqlite3'))
+            keep = bool(options['keep_db'])
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, keepdb=keep)
+            try:
+                report = self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(
+                    old_name, verbosity=0, keepdb=keep)
+                settings_dict['TEST'] = old_test
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        self.stdout.write(output)
+
+    def benchmark(self, options):
+        seconds = None
+        if not BookCatalog.objects.exists():
+            self.stderr.write('seeding...')
+            started = time.perf_counter()
+            seed(options['books'], options['authors'], options['categories'],
+                options['readers'], options['trackers'], options['reviews'],
+                seed=options['seed'])
+            seconds = round(time.perf_counter() - started, 1)
+
+        scenarios = {name: SCENARIOS[name]
+            for name in options['scenarios'] or SCENARIOS}
+        report = {'dataset': dataset(), 'seed_seconds': seconds}
+        report.update(run(options['threads'], options['requests'],
+            options['warmup'], scenarios, seed=options['seed']))
+        return report
@@ -0,0 +1,78 @@
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from management.models import Category, BookCatalog, ReadersTracker
+from management.progress import ProgressBuffer
+
+
+class Command(BaseCommand):
+    help = ('Measure reading progress updates per second, one write per '
+        'update against the write-behind buffer, on a throwaway test '
+        'database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=20000)
+        parser.add_argument('--readers', type=int, default=50)
+        parser.add_argument('--books', type=int, default=200)
+        parser.add_argument('--buffer-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def heartbeats(self, options, readers, books):
+        rng = random.Random(options['seed'])
+        return [(rng.choice(readers), rng.choice(books), rng.randint(0, 100))
+            for _ in range(options['updates'])]
+
+    def direct(self, heartbeats):
+        # the PostReadersTrackerSerializer.create path
+        for reader_id, book_id, percent in heartbeats:
+            tracker, created = ReadersTracker.objects.get_or_create(
+                book_id=book_id, reader_id=reader_id)
+            if not created and percent > tracker.percent:
+                tracker.percent = percent
+                tracker.save()
+
+    def buffered(self, heartbeats, size):
+        buffer = ProgressBuffer(max_size=size, interval=None)
+        for reader_id, book_id, percent in heartbeats:
+            buffer.add(reader_id, book_id, percent)
+        buffer.flush()
+
+    def measure(self, run, *args):
+        ReadersTracker.objects.all().delete()
+        started = time.perf_counter()
+        run(*args)
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            category = Category.objects.create(name='benchmark')
+            BookCatalog.objects.bulk_create(BookCatalog(
+                name='book {0}'.format(number), category=category)
+                for number in range(options['books']))
+            User.objects.bulk_create(User(
+                username='reader{0}'.format(number))
+                for number in range(options['readers']))
+            heartbeats = self.heartbeats(options,
+                list(User.objects.values_list('pk', flat=True)),
+                list(BookCatalog.objects.values_list('pk', flat=True)))
+
+            direct = self.measure(self.direct, heartbeats)
+            buffered = self.measure(
+                self.buffered, heartbeats, options['buffer_size'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(json.dumps({
+            'updates': options['updates'],
+            'updates_per_second': {
+                'direct': round(options['updates'] / direct),
+                'buffered': round(options['updates'] / buffered),
+            },
+        }, indent=2))
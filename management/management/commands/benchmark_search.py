@@ -0,0 +1,90 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from management.benchmark import percentile
+from management.search import RANK, SEARCH_TABLE, match_expression
+
+
+SYLLABLES = ['ba', 'ce', 'di', 'fo', 'gu', 'ha', 'ke', 'li', 'mo', 'nu',
+    'pa', 're', 'si', 'to', 'vu', 'wa', 'xe', 'yi', 'zo', 'ru']
+
+# 8000 made-up words, so terms are about as selective as real titles
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+
+class Command(BaseCommand):
+    help = ('Measure full text search latency on a synthetic catalog, '
+        'built in a scratch SQLite file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def phrase(self, rng, words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+    def populate(self, db, rows, rng):
+        db.execute(
+            'CREATE VIRTUAL TABLE {0} USING fts5(name, description, '
+            "authors, category, tokenize = 'unicode61 remove_diacritics 2')"
+            .format(SEARCH_TABLE))
+        batch = []
+        for book_id in range(1, rows + 1):
+            batch.append((book_id, self.phrase(rng, 3),
+                self.phrase(rng, 30), self.phrase(rng, 2),
+                self.phrase(rng, 1)))
+            if len(batch) == 10000 or book_id == rows:
+                db.executemany(
+                    'INSERT INTO {0} (rowid, name, description, authors, '
+                    'category) VALUES (?, ?, ?, ?, ?)'.format(SEARCH_TABLE),
+                    batch)
+                batch = []
+        db.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(
+            SEARCH_TABLE))
+        db.commit()
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        try:
+            db = sqlite3.connect(path)
+            started = time.perf_counter()
+            self.populate(db, options['rows'], rng)
+            build = time.perf_counter() - started
+
+            timings = []
+            for _ in range(options['queries']):
+                # drop the end of the last word to exercise prefix queries
+                query = self.phrase(rng, rng.randint(1, 2))[:-1]
+                expression = match_expression(query)
+                started = time.perf_counter()
+                db.execute('SELECT count(*) FROM {0} WHERE {0} MATCH ?'
+                    .format(SEARCH_TABLE), [expression]).fetchone()
+                db.execute(
+                    'SELECT rowid FROM {0} WHERE {0} MATCH ? ORDER BY {1} '
+                    'LIMIT ?'.format(SEARCH_TABLE, RANK),
+                    [expression, options['page_size']]).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            db.close()
+        finally:
+            os.remove(path)
+
+        self.stdout.write(json.dumps({
+            'rows': options['rows'],
+            'queries': options['queries'],
+            'build_seconds': round(build, 2),
+            'latency_ms': {
+                'p50': round(percentile(timings, 50), 2),
+                'p95': round(percentile(timings, 95), 2),
+                'p99': round(percentile(timings, 99), 2),
+            },
+        }, indent=2))
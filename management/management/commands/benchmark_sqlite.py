@@ -0,0 +1,129 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.test.utils import override_settings
+
+from management.models import Category, BookCatalog, BookStats
+from management.progress import apply_progress
+
+
+PROFILES = {
+    # the stock sqlite3 backend and DATABASES settings
+    'before': {'SQLITE_PRAGMAS': {}, 'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+        'CONN_MAX_AGE': 0},
+    # the settings of a deployment, WAL included
+    'after': {'SQLITE_PRAGMAS': dict(settings.SQLITE_PRAGMAS,
+        journal_mode='wal')},
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent catalog reads and progress writes on a '
+        'throwaway SQLite file, with the old defaults and with the '
+        'SQLITE_PRAGMAS profile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--readers', type=int, default=50)
+        parser.add_argument('--books', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def setup_data(self, options):
+        category = Category.objects.create(name='benchmark')
+        BookCatalog.objects.bulk_create(BookCatalog(
+            name='book {0}'.format(number), category=category)
+            for number in range(options['books']))
+        # bulk_create sends no signals, the stats rows are made here
+        BookStats.objects.bulk_create(BookStats(book_id=pk)
+            for pk in BookCatalog.objects.values_list('pk', flat=True))
+        User.objects.bulk_create(User(username='reader{0}'.format(number))
+            for number in range(options['readers']))
+        return (list(User.objects.values_list('pk', flat=True)),
+            list(BookCatalog.objects.values_list('pk', flat=True)))
+
+    def worker(self, number, options, readers, books, deadline, totals):
+        rng = random.Random(options['seed'] + number)
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    if rng.random() < options['write_ratio']:
+                        apply_progress({(rng.choice(readers),
+                            rng.choice(books)): rng.randint(0, 100)})
+                        counts['writes'] += 1
+                    else:
+                        start = rng.randint(0, len(books))
+                        list(BookCatalog.objects.select_related('category')
+                            .filter(id__gt=start).order_by('id')[:20])
+                        counts['reads'] += 1
+                except OperationalError:
+                    counts['locked'] += 1
+                # what request_finished does after each request
+                close_old_connections()
+        finally:
+            connection.close()
+            with totals['lock']:
+                for name, value in counts.items():
+                    totals[name] += value
+
+    def run_profile(self, options, readers, books):
+        totals = {'lock': threading.Lock(), 'reads': 0, 'writes': 0,
+            'locked': 0}
+        deadline = time.monotonic() + options['seconds']
+        threads = [threading.Thread(target=self.worker,
+            args=(number, options, readers, books, deadline, totals))
+            for number in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'reads_per_second': round(totals['reads'] / options['seconds']),
+            'writes_per_second': round(
+                totals['writes'] / options['seconds']),
+            'locked_errors': totals['locked'],
+        }
+
+    def handle(self, *args, **options):
+        results = {}
+        settings_dict = connection.settings_dict
+        old_name, old_test = settings_dict['NAME'], settings_dict['TEST']
+        old_max_age = settings_dict['CONN_MAX_AGE']
+        for profile, overrides in PROFILES.items():
+            overrides = dict(overrides)
+            max_age = overrides.pop('CONN_MAX_AGE', old_max_age)
+            with tempfile.TemporaryDirectory() as directory, \
+                    override_settings(**overrides):
+                # a file, the in-memory test database has no journal
+                settings_dict['TEST'] = dict(old_test,
+                    NAME=os.path.join(directory, 'benchmark.sqlite3'))
+                settings_dict['CONN_MAX_AGE'] = max_age
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=True)
+                try:
+                    readers, books = self.setup_data(options)
+                    connection.close()
+                    results[profile] = self.run_profile(
+                        options, readers, books)
+                finally:
+                    connection.creation.destroy_test_db(
+                        old_name, verbosity=0)
+                    settings_dict['TEST'] = old_test
+                    settings_dict['CONN_MAX_AGE'] = old_max_age
+
+        self.stdout.write(json.dumps({
+            'threads': options['threads'],
+            'seconds': options['seconds'],
+            'write_ratio': options['write_ratio'],
+            'profiles': results,
+        }, indent=2))
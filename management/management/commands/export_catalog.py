@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.exceptions import ValidationError
+
+from management.exports import EXPORT_CHUNK_SIZE, EXPORTS, export_lines
+
+
+class Command(BaseCommand):
+    help = ('Stream the books or the reading trackers as NDJSON or CSV, '
+        'in constant memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--output', default='ndjson',
+            choices=('ndjson', 'csv'))
+        parser.add_argument('--updated-after')
+        parser.add_argument('--updated-before')
+        parser.add_argument('--chunk-size', type=int,
+            default=EXPORT_CHUNK_SIZE)
+        parser.add_argument('--file', help='Write there, not to stdout.')
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in
+            ('updated_after', 'updated_before') if options[name]}
+        try:
+            lines = export_lines(options['export'], options['output'],
+                params, options['chunk_size'])
+        except ValidationError as error:
+            raise CommandError(error.detail)
+
+        if options['file']:
+            with open(options['file'], 'w', encoding='utf-8',
+                    newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,31 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from management.blobs import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = ('Delete the content addressed files no book refers to '
+        'anymore.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float,
+            default=settings.CAS_GC_GRACE_HOURS,
+            help='Keep files touched more recently than this.')
+        parser.add_argument('--recount', action='store_true',
+            help='Rebuild the reference counts from the books first.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write('{0} reference counts repaired'.format(
+                recount()))
+        removed = collect_garbage(
+            grace=datetime.timedelta(hours=options['grace_hours']),
+            dry_run=options['dry_run'])
+        for name in removed:
+            self.stdout.write(name)
+        self.stdout.write('{0} files {1}'.format(len(removed),
+            'to delete' if options['dry_run'] else 'deleted'))
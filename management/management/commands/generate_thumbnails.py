@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+
+from management.models import BookCatalog
+from management.tasks import (has_uploaded_cover, mark_thumbnails,
+    render_thumbnails)
+
+
+class Command(BaseCommand):
+    help = ('Generate the missing or stale cover thumbnails, covers are '
+        'rendered in parallel worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--all', action='store_true',
+            help='Regenerate the thumbnails of every cover.')
+
+    def handle(self, *args, **options):
+        books = BookCatalog.objects.all()
+        if not options['all']:
+            books = books.exclude(thumbnail_source=F('book_cover'))
+        covers = {book_id: cover for book_id, cover
+            in books.values_list('id', 'book_cover').iterator()
+            if has_uploaded_cover(cover)}
+
+        # workers only touch the storage, the forked processes must not
+        # share the database connection of this one
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(render_thumbnails, cover): book_id
+                for book_id, cover in covers.items()}
+            for future in as_completed(futures):
+                book_id = futures[future]
+                try:
+                    mark_thumbnails(book_id, future.result())
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write('book {0}: {1}'.format(book_id, error))
+        self.stdout.write('{0} covers done, {1} failed'.format(done, failed))
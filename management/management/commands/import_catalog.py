@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from library.cache import bump_version
+from management.models import (Category, Author, BookCatalog, BookStats,
+    AuthorStats, CategoryStats)
+from management.search import index_book_range
+from management.signals import CATALOG_CACHE
+from management import stats
+
+
+LOOKUP_SIZE = 500
+
+
+def next_id(model):
+    """First id of rows inserted with explicit ids. SQLite tables are
+    AUTOINCREMENT, the ids of deleted rows are never handed out again:
+    the last one given is in sqlite_sequence, not in MAX(id)."""
+    last = model.objects.aggregate(last=Max('id'))['last'] or 0
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                [model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None:
+            last = max(last, row[0])
+    return last + 1
+
+
+def insert_rows(model, columns, rows):
+    """executemany() INSERT, the ORM bulk_create costs more than SQLite
+    itself at this volume. Values go in as they are, already adapted."""
+    with connection.cursor() as cursor:
+        cursor.executemany('INSERT INTO {0} ({1}) VALUES ({2})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns))), rows)
+
+
+class NameCache(object):
+    __doc__ = """get-or-create of Category and Author names, kept in
+    memory for the whole import. Existing duplicate names resolve to the
+    oldest row."""
+
+    def __init__(self, model, stats_model):
+        self.model = model
+        self.stats_model = stats_model
+        self.ids = {}
+
+    def resolve(self, names):
+        """Load or create the missing names, in bulk."""
+        missing = sorted(set(names) - set(self.ids))
+        for start in range(0, len(missing), LOOKUP_SIZE):
+            rows = self.model.objects.filter(
+                name__in=missing[start:start + LOOKUP_SIZE]).order_by('-id')
+            self.ids.update(rows.values_list('name', 'id'))
+
+        missing = [name for name in missing if name not in self.ids]
+        if missing:
+            # ids are assigned here, bulk_create does not return them
+            first = next_id(self.model)
+            self.model.objects.bulk_create(self.model(id=first + offset,
+                name=name) for offset, name in enumerate(missing))
+            self.stats_model.objects.bulk_create(
+                self.stats_model(pk=first + offset)
+                for offset in range(len(missing)))
+            self.ids.update((name, first + offset)
+                for offset, name in enumerate(missing))
+
+
+class Command(BaseCommand):
+    help = ('Import books from a CSV or JSON lines file (name, category, '
+        'authors, description) with bulk inserts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+            help='Guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--offset', type=int, default=0,
+            help='Skip this many records, to resume an import.')
+        parser.add_argument('--author-separator', default='|',
+            help='Separator of the CSV authors column.')
+
+    def records(self, stream, file_format, separator):
+        if file_format == 'csv':
+            for row in csv.DictReader(stream):
+                row['authors'] = [name for name in (row.get('authors')
+                    or '').split(separator)]
+                yield row
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+    def clean(self, number, record):
+        name = (record.get('name') or '').strip()
+        category = (record.get('category') or '').strip()
+        if not name or not category:
+            self.stderr.write('record {0}: name and category are '
+                'required, skipped'.format(number))
+            return None
+        authors = record.get('authors') or []
+        if isinstance(authors, str):
+            authors = [authors]
+        return {
+            'name': name[:100],
+            'category': category[:100],
+            'authors': list(dict.fromkeys(author.strip()[:100]
+                for author in authors if author.strip())),
+            'description': record.get('description') or '',
+        }
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        self.categories.resolve(record['category'] for record in batch)
+        self.authors.resolve(author for record in batch
+            for author in record['authors'])
+
+        first = next_id(BookCatalog)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        books, links, book_stats = [], [], []
+        category_counts, author_counts = Counter(), Counter()
+        for book_id, record in enumerate(batch, first):
+            category_id = self.categories.ids[record['category']]
+            books.append((book_id, record['name'], record['description'],
+                category_id, self.book_cover, self.file, '', now, now))
+            book_stats.append((book_id, 0, 0, 0))
+            category_counts[category_id] += 1
+            for author in record['authors']:
+                author_id = self.authors.ids[author]
+                links.append((book_id, author_id))
+                author_counts[author_id] += 1
+
+        # bulk inserts send no signals, maintain what the signals would
+        insert_rows(BookCatalog, ('id', 'name', 'description', 'category_id',
+            'book_cover', 'file', 'thumbnail_source', 'created', 'updated'),
+            books)
+        insert_rows(BookCatalog.author.through,
+            ('bookcatalog_id', 'author_id'), links)
+        insert_rows(BookStats, ('book_id', 'review_count', 'reader_count',
+            'completed_count'), book_stats)
+        stats.increment_many(CategoryStats, 'book_count', category_counts)
+        stats.increment_many(AuthorStats, 'book_count', author_counts)
+        index_book_range(first, first + len(books) - 1)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        elif os.path.exists(path):
+            stream = open(path, encoding='utf-8', newline='')
+        else:
+            raise CommandError('{0} does not exist.'.format(path))
+
+        self.book_cover = BookCatalog._meta.get_field('book_cover').default
+        self.file = BookCatalog._meta.get_field('file').default
+        self.categories = NameCache(Category, CategoryStats)
+        self.authors = NameCache(Author, AuthorStats)
+        started = time.perf_counter()
+        imported = skipped = 0
+        offset = options['offset']
+        batch = []
+        with stream:
+            records = self.records(
+                stream, file_format, options['author_separator'])
+            for number, record in enumerate(records):
+                if number < options['offset']:
+                    continue
+                record = self.clean(number, record)
+                if record is None:
+                    skipped += 1
+                else:
+                    batch.append(record)
+                if len(batch) == options['batch_size']:
+                    self.import_batch(batch)
+                    imported += len(batch)
+                    offset = number + 1
+                    batch = []
+                    self.report(imported, offset, started)
+            if batch:
+                self.import_batch(batch)
+                imported += len(batch)
+                offset = number + 1
+
+        bump_version(CATALOG_CACHE)
+        self.report(imported, offset, started)
+        self.stdout.write(self.style.SUCCESS(
+            '{0} books imported, {1} skipped.'.format(imported, skipped)))
+
+    def report(self, imported, offset, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write('{0} books, {1:.0f}/s, resume with --offset {2}'
+            .format(imported, imported / elapsed if elapsed else 0, offset))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from management.models import BookCatalog
+from management.search import rebuild_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search index of the book catalog.'
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError('Full text search needs the SQLite backend.')
+
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {0} books.'.format(BookCatalog.objects.count())))
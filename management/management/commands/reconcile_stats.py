@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from management.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the book, author and category stats and repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        repaired = reconcile(batch_size=options['batch_size'])
+        for owner, count in repaired.items():
+            self.stdout.write('{0}: {1} rows repaired'.format(owner, count))
+        self.stdout.write(self.style.SUCCESS('Stats reconciled.'))
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the default SQLite database into the DATABASE_REPLICAS '
+        'files with the online backup API, once or every --interval '
+        'seconds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+            help='Keep refreshing, this many seconds apart.')
+        parser.add_argument('--pages', type=int, default=1024,
+            help='Pages copied per step, writers may run in between.')
+
+    def refresh(self, alias, pages):
+        source = connections['default']
+        source.ensure_connection()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'],
+            timeout=settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000)
+        try:
+            started = time.perf_counter()
+            source.connection.backup(target, pages=pages)
+        finally:
+            target.close()
+        self.stdout.write('{0} refreshed in {1:.2f}s'.format(
+            alias, time.perf_counter() - started))
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No DATABASE_REPLICAS are configured.')
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Only SQLite databases are copied.')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                self.refresh(alias, options['pages'])
+            if not options['interval']:
+                return
+            connections['default'].close()
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite write-ahead log back into the database file, '
+        'TRUNCATE also shrinks the log to zero bytes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='TRUNCATE',
+            choices=('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases have a WAL to '
+                'checkpoint.')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint({0})'.format(
+                options['mode']))
+            busy, frames, checkpointed = cursor.fetchone()
+        if frames < 0:
+            self.stdout.write('The database is not in WAL mode.')
+            return
+        self.stdout.write('{0} of {1} WAL frames checkpointed'.format(
+            checkpointed, frames))
+        if busy:
+            self.stderr.write('Readers or writers kept the checkpoint from '
+                'completing, run it again.')
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.5 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0002_auto_20190919_0851'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bookcatalog',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-created'], name='review_book_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE management_book_search USING fts5("
+        "name, description, authors, category, "
+        "tokenize = 'unicode61 remove_diacritics 2')")
+    schema_editor.execute('''
+        INSERT INTO management_book_search
+            (rowid, name, description, authors, category)
+        SELECT book.id, book.name, book.description,
+            COALESCE((
+                SELECT group_concat(author.name, ' ')
+                FROM management_bookcatalog_author link
+                JOIN management_author author ON author.id = link.author_id
+                WHERE link.bookcatalog_id = book.id), ''),
+            category.name
+        FROM management_bookcatalog book
+        JOIN management_category category ON category.id = book.category_id
+    ''')
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE management_book_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0003_auto_20261018_1936'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
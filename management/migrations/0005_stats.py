@@ -0,0 +1,69 @@
+# Generated by Django 2.2.5 on 2026-10-18 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0004_book_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='management.Author')),
+                ('book_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='management.BookCatalog')),
+                ('review_count', models.IntegerField(default=0)),
+                ('reader_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='management.Category')),
+                ('book_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO management_bookstats
+                (book_id, review_count, reader_count, completed_count)
+            SELECT book.id,
+                (SELECT COUNT(*) FROM management_review review
+                    WHERE review.book_id = book.id),
+                (SELECT COUNT(*) FROM management_readerstracker tracker
+                    WHERE tracker.book_id = book.id),
+                (SELECT COUNT(*) FROM management_readerstracker tracker
+                    WHERE tracker.book_id = book.id AND tracker.percent = 100)
+            FROM management_bookcatalog book
+            """,
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            """
+            INSERT INTO management_authorstats (author_id, book_count)
+            SELECT author.id,
+                (SELECT COUNT(*) FROM management_bookcatalog_author link
+                    WHERE link.author_id = author.id)
+            FROM management_author author
+            """,
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            """
+            INSERT INTO management_categorystats (category_id, book_count)
+            SELECT category.id,
+                (SELECT COUNT(*) FROM management_bookcatalog book
+                    WHERE book.category_id = category.id)
+            FROM management_category category
+            """,
+            migrations.RunSQL.noop),
+    ]
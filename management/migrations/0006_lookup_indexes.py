@@ -0,0 +1,52 @@
+# Generated by Django 2.2.5 on 2026-10-18 19:50
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def dedupe_trackers(apps, schema_editor):
+    """Keep one tracker per (book, reader), the furthest read one, and
+    recount the readers of the books that had duplicates."""
+    ReadersTracker = apps.get_model('management', 'ReadersTracker')
+    BookStats = apps.get_model('management', 'BookStats')
+
+    duplicates = ReadersTracker.objects.values('book_id', 'reader_id').annotate(
+        total=Count('pk')).filter(total__gt=1).order_by()
+    book_ids = set()
+    for row in duplicates.iterator():
+        trackers = ReadersTracker.objects.filter(
+            book_id=row['book_id'], reader_id=row['reader_id'])
+        keep = trackers.order_by('-percent', 'id').values_list(
+            'pk', flat=True)[0]
+        trackers.exclude(pk=keep).delete()
+        book_ids.add(row['book_id'])
+
+    counts = ReadersTracker.objects.filter(book_id__in=book_ids).values(
+        'book_id').annotate(readers=Count('pk'),
+        completed=Count('pk', filter=Q(percent=100))).order_by()
+    for row in counts:
+        BookStats.objects.filter(pk=row['book_id']).update(
+            reader_count=row['readers'], completed_count=row['completed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0005_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_trackers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='readerstracker',
+            index=models.Index(fields=['reader', 'updated'], name='tracker_reader_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', 'reader'], name='review_book_reader_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='readerstracker',
+            constraint=models.UniqueConstraint(fields=('book', 'reader'), name='tracker_book_reader_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.5 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0006_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookcatalog',
+            name='thumbnail_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.5 on 2026-10-18 19:56
+
+from django.db import migrations, models
+import library.storage
+import management.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0008_book_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bookcatalog',
+            name='book_cover',
+            field=models.ImageField(default='../default/default_cover.png', storage=library.storage.ContentAddressedStorage(), upload_to=management.models.book_cover_path),
+        ),
+        migrations.AlterField(
+            model_name='bookcatalog',
+            name='file',
+            field=models.FileField(default='../default/nobook.pdf', storage=library.storage.ContentAddressedStorage(), upload_to=management.models.book_file_path),
+        ),
+    ]
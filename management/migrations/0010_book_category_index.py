@@ -0,0 +1,23 @@
+# Generated by Django 2.2.5 on 2026-10-18 21:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0009_stored_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookcatalog',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='books', to='management.Category'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcatalog',
+            index=models.Index(fields=['category', '-id'], name='book_category_id_idx'),
+        ),
+    ]
@@ -0,0 +1,143 @@
+import calendar
+import copy
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from library.cache import (get_version, response_cache, version_time,
+    versioned_key)
+from library.routers import primary_reads
+from .serializers import reviewable_book_ids
+from .signals import CATALOG_CACHE, reader_cache
+
+
+def _per_user_items(data, field):
+    """Dicts of a serialized payload carrying the per-user `field`."""
+    if isinstance(data, dict):
+        if field in data:
+            yield data
+        for value in data.values():
+            yield from _per_user_items(value, field)
+    elif isinstance(data, list):
+        for value in data:
+            yield from _per_user_items(value, field)
+
+
+class CachedReadMixin(object):
+    __doc__ = """Serves list and retrieve from the versioned response
+    cache. Per-user fields are blanked in the shared entry and filled in
+    again for the requesting user on every response. Entries are built
+    from default, never from a replica."""
+
+    cache_namespace = CATALOG_CACHE
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request,
+            lambda: super(CachedReadMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request,
+            lambda: super(CachedReadMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    def get_cache_key(self, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        return versioned_key(self.cache_namespace,
+            request.build_absolute_uri(request.path), query)
+
+    def cached_response(self, request, build_response):
+        key = self.get_cache_key(request)
+        data = response_cache.get(key)
+        if data is None:
+            # stored under the current version, it must not be older
+            with primary_reads():
+                response = build_response()
+            if response.status_code == status.HTTP_200_OK:
+                response_cache.set(key, self.make_shared(response.data))
+            return response
+        return Response(self.personalize(request, copy.deepcopy(data)))
+
+    def make_shared(self, data):
+        data = copy.deepcopy(data)
+        for item in _per_user_items(data, 'can_review'):
+            item['can_review'] = None
+        return data
+
+    def personalize(self, request, data):
+        items = list(_per_user_items(data, 'can_review'))
+        reviewable = reviewable_book_ids(
+            request, [item['id'] for item in items])
+        for item in items:
+            item['can_review'] = item['id'] in reviewable
+        return data
+
+
+class ConditionalGetMixin(object):
+    __doc__ = """ETag / Last-Modified validators for list and retrieve,
+    checked before anything is serialized. Both follow the `updated`
+    column of the rows and the catalog and reader cache versions, so they
+    change with deletes, nested authors, categories, reviews and the
+    user's own can_review."""
+
+    # validators come from the bare queryset, the serializer query plan
+    # of get_queryset() would only turn the aggregate into a subquery
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.queryset.all())
+        return self.conditional_response(request, queryset,
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        build_response = lambda: super(ConditionalGetMixin, self).retrieve(
+            request, *args, **kwargs)
+        try:
+            queryset = self.queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup]})
+        except (ValueError, TypeError):
+            # not a valid pk, get_object() answers 404
+            return build_response()
+        return self.conditional_response(request, queryset, build_response)
+
+    def get_validators(self, request, queryset):
+        # they come with the current cache versions, as the cached entry
+        with primary_reads():
+            state = queryset.order_by().aggregate(
+                last_modified=Max('updated'), count=Count('pk'))
+        if not state['count']:
+            return None, None
+
+        last_modified = max(
+            calendar.timegm(state['last_modified'].utctimetuple()),
+            version_time(CATALOG_CACHE),
+            version_time(reader_cache(request.user.id)))
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        etag = md5('|'.join(str(part) for part in (
+            get_version(CATALOG_CACHE),
+            get_version(reader_cache(request.user.id)),
+            state['last_modified'].isoformat(), state['count'],
+            request.build_absolute_uri(request.path), query,
+        )).encode()).hexdigest()
+        return quote_etag(etag), last_modified
+
+    def conditional_response(self, request, queryset, build_response):
+        etag, last_modified = self.get_validators(request, queryset)
+        if etag is None:
+            return build_response()
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build_response()
+        if response.status_code in (status.HTTP_200_OK,
+                status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
@@ -1,5 +1,12 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+
+from library.storage import cas_storage
 
 
 class TimeStampModel(models.Model):
@@ -29,17 +36,14 @@ class Author(models.Model):
 
 
 def book_cover_path(instance, filename):
-    splitted = filename.split('.')
-    extension = splitted[1]
-    return 'book_cover/{0}_{1}.{2}'.format(
-        instance.id, splitted[0], extension)
+    name, extension = os.path.splitext(filename)
+    return 'book_cover/{0}_{1}{2}'.format(instance.id, name, extension)
 
 
 def book_file_path(instance, filename):
-    splitted = filename.split('.')
-    extension = splitted[1]
-    return 'book_file/{1}.{2}'.format(
-        instance.id, splitted[0], extension)
+    # cas_storage keeps only the extension, it must survive dotted names
+    name, extension = os.path.splitext(filename)
+    return 'book_file/{0}{1}'.format(name, extension)
 
 
 class BookCatalog(TimeStampModel):
@@ -49,23 +53,40 @@ class BookCatalog(TimeStampModel):
     book_cover = models.ImageField(
         blank=False,
         upload_to=book_cover_path,
+        storage=cas_storage,
         default='../default/default_cover.png')
     description = models.TextField(default='')
+    # indexed by book_category_id_idx below
     category = models.ForeignKey(Category,
         on_delete=models.CASCADE,
-        related_name='books')
+        related_name='books', db_index=False)
     author = models.ManyToManyField(Author,
         related_name='books')
     file = models.FileField(
         default='../default/nobook.pdf',
         blank=False,
-        upload_to=book_file_path,)
+        upload_to=book_file_path,
+        storage=cas_storage,)
+    # cover the thumbnails were generated from, stale once it differs
+    thumbnail_source = models.CharField(max_length=100, blank=True,
+        default='', editable=False)
 
     class Meta:
         ordering = ['-id']
+        # category pages, newest first. It replaces the category_id
+        # index, whose implicit rowid suffix sorted -id just as well
+        indexes = [
+            models.Index(fields=['category', '-id'],
+                name='book_category_id_idx'),
+        ]
 
     def __str__(self):
         return '{}'.format(self.name)
+
+    @cached_property
+    def latest_reviews(self):
+        return list(self.reviews.order_by('-created', '-id')
+            [:settings.BOOK_LATEST_REVIEWS])
     
 
 class Review(TimeStampModel):
@@ -75,7 +96,14 @@ class Review(TimeStampModel):
         on_delete=models.CASCADE, related_name='reviews')
     review = models.CharField(max_length=100)
     reader = models.ForeignKey(User, on_delete=models.CASCADE)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', '-created'],
+                name='review_book_latest_idx'),
+            models.Index(fields=['book', 'reader'],
+                name='review_book_reader_idx'),
+        ]
 
     def __str__(self):
         return 'Book: {0} - {1}'.format(self.book.name, self.review)
@@ -90,6 +118,89 @@ class ReadersTracker(TimeStampModel):
         on_delete=models.CASCADE, related_name='readerstraker')
     percent = models.IntegerField(default=0)
 
+    class Meta:
+        # scanned backwards for -updated, -id; ascending keys match the
+        # implicit id suffix of the index in both directions
+        indexes = [
+            models.Index(fields=['reader', 'updated'],
+                name='tracker_reader_updated_idx'),
+        ]
+        # also the index of (book, reader) lookups
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'reader'],
+                name='tracker_book_reader_unique'),
+        ]
+
     def __str__(self):
         return 'Book: {0} - {1}'.format(
             self.reader.username, self.book.name)
+
+
+class BookStats(models.Model):
+    __doc__ = "Denormalized book counters"
+
+    book = models.OneToOneField(BookCatalog, primary_key=True,
+        on_delete=models.CASCADE, related_name='stats')
+    review_count = models.IntegerField(default=0)
+    reader_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return 'Book: {0}'.format(self.book_id)
+
+    @property
+    def completion_rate(self):
+        if not self.reader_count:
+            return 0.0
+        return round(self.completed_count / self.reader_count, 2)
+
+
+class AuthorStats(models.Model):
+    __doc__ = "Denormalized author counters"
+
+    author = models.OneToOneField(Author, primary_key=True,
+        on_delete=models.CASCADE, related_name='stats')
+    book_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return 'Author: {0}'.format(self.author_id)
+
+
+class CategoryStats(models.Model):
+    __doc__ = "Denormalized category counters"
+
+    category = models.OneToOneField(Category, primary_key=True,
+        on_delete=models.CASCADE, related_name='stats')
+    book_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return 'Category: {0}'.format(self.category_id)
+
+
+class BookUpload(TimeStampModel):
+    __doc__ = "Resumable upload of a book file"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+        editable=False)
+    book = models.ForeignKey(BookCatalog,
+        on_delete=models.CASCADE, related_name='uploads')
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    completed = models.BooleanField(default=False)
+
+    def __str__(self):
+        return 'Upload: {0} - {1}'.format(self.book_id, self.filename)
+
+
+class StoredBlob(models.Model):
+    __doc__ = "References to a content addressed file"
+
+    name = models.CharField(max_length=100, primary_key=True)
+    references = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.name, self.references)
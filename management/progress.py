@@ -0,0 +1,166 @@
+import atexit
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from library.cache import bump_version
+from .models import BookCatalog, ReadersTracker, BookStats
+from .signals import reader_cache
+from . import stats
+
+
+def apply_progress(updates, read_at=None):
+    """Monotonic upsert of reading progress, `updates` maps
+    (reader_id, book_id) to a percent. Runs in one transaction: one
+    query validates the books, one reads the existing trackers, then one
+    bulk INSERT and one UPDATE setting percent = max(percent, new).
+
+    `read_at` optionally maps keys to when the progress was made, offline
+    clients replaying it later. It becomes the `updated` of the trackers
+    it creates or raises, never later than now, never moving back.
+
+    Returns {key: {'percent': ..., 'status': ...}} with the status
+    'created', 'updated', 'unchanged' or 'invalid' (unknown book)."""
+    if not updates:
+        return {}
+
+    now = timezone.now()
+    read_at = {key: min(value, now)
+        for key, value in (read_at or {}).items() if value}
+    results = {}
+    with transaction.atomic():
+        books = set(BookCatalog.objects.filter(
+            pk__in={book_id for reader_id, book_id in updates}
+        ).values_list('pk', flat=True))
+        for key, percent in updates.items():
+            if key[1] not in books:
+                results[key] = {'percent': percent, 'status': 'invalid'}
+        updates = {key: percent for key, percent in updates.items()
+            if key not in results}
+
+        existing = {}
+        for tracker in ReadersTracker.objects.filter(
+                reader_id__in={reader_id for reader_id, book_id in updates},
+                book_id__in={book_id for reader_id, book_id in updates}
+                ).only('id', 'reader_id', 'book_id', 'percent'):
+            key = (tracker.reader_id, tracker.book_id)
+            if key in updates:
+                existing[key] = tracker
+
+        created = [ReadersTracker(reader_id=reader_id, book_id=book_id,
+            percent=percent) for (reader_id, book_id), percent
+            in updates.items() if (reader_id, book_id) not in existing]
+        ReadersTracker.objects.bulk_create(created)
+        # bulk_create stamps them now, auto_now cannot be overridden
+        backdated = [(tracker.reader_id, tracker.book_id) for tracker
+            in created if (tracker.reader_id, tracker.book_id) in read_at]
+        if backdated:
+            ReadersTracker.objects.filter(
+                reader_id__in={reader_id for reader_id, book_id in backdated},
+                book_id__in={book_id for reader_id, book_id in backdated},
+            ).update(updated=Case(
+                *[When(reader_id=reader_id, book_id=book_id,
+                    then=Value(read_at[reader_id, book_id],
+                        output_field=DateTimeField()))
+                    for reader_id, book_id in backdated],
+                default=F('updated'), output_field=DateTimeField()))
+
+        raised = {key: tracker for key, tracker in existing.items()
+            if updates[key] > tracker.percent}
+        if raised:
+            ReadersTracker.objects.filter(
+                pk__in=[tracker.pk for tracker in raised.values()]
+            ).update(updated=Case(
+                *[When(pk=tracker.pk, then=Greatest(F('updated'),
+                    Value(read_at[key], output_field=DateTimeField())))
+                    for key, tracker in raised.items() if key in read_at],
+                default=Value(now), output_field=DateTimeField()),
+                percent=Case(
+                *[When(pk=tracker.pk, then=Greatest(
+                    F('percent'), Value(updates[key])))
+                    for key, tracker in raised.items()],
+                default=F('percent')))
+
+        # bulk queries send no signals, keep the stats and caches current
+        counters = defaultdict(lambda: {'reader_count': 0,
+            'completed_count': 0})
+        for tracker in created:
+            counters[tracker.book_id]['reader_count'] += 1
+            counters[tracker.book_id]['completed_count'] += int(
+                tracker.percent == 100)
+        for key, tracker in raised.items():
+            counters[key[1]]['completed_count'] += int(
+                updates[key] == 100)
+        for book_id, deltas in counters.items():
+            stats.increment(BookStats, book_id, **deltas)
+
+    for key, percent in updates.items():
+        if key not in existing:
+            status = 'created'
+        elif key in raised:
+            status = 'updated'
+        else:
+            status = 'unchanged'
+            percent = existing[key].percent
+        results[key] = {'percent': percent, 'status': status}
+
+    changed = set(raised) | {(tracker.reader_id, tracker.book_id)
+        for tracker in created}
+    for reader_id in {reader_id for reader_id, book_id in changed}:
+        bump_version(reader_cache(reader_id))
+    return results
+
+
+class ProgressBuffer(object):
+    __doc__ = """Write-behind buffer of reading progress. Heartbeats of
+    the same (reader, book) coalesce into the highest percent; pending
+    updates are written with apply_progress once `max_size` keys are
+    waiting or `interval` seconds after the first pending update."""
+
+    def __init__(self, max_size=500, interval=5.0):
+        self.max_size = max_size
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, reader_id, book_id, percent):
+        key = (reader_id, book_id)
+        with self._lock:
+            self._pending[key] = max(percent, self._pending.get(key, 0))
+            full = len(self._pending) >= self.max_size
+            if not full and self._timer is None and self.interval:
+                self._timer = threading.Timer(
+                    self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write the pending updates, returns how many were written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        apply_progress(pending)
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # the timer thread has its own connection
+            connection.close()
+
+
+progress_buffer = ProgressBuffer(
+    max_size=settings.PROGRESS_BUFFER_SIZE,
+    interval=settings.PROGRESS_FLUSH_INTERVAL)
+atexit.register(progress_buffer.flush)
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection
+
+from .models import Category, Author, BookCatalog
+
+
+SEARCH_TABLE = 'management_book_search'
+
+# bm25 column weights: name, description, authors, category
+RANK = 'bm25({0}, 10.0, 1.0, 5.0, 2.0)'.format(SEARCH_TABLE)
+
+INDEX_SQL = '''
+    INSERT INTO {search} (rowid, name, description, authors, category)
+    SELECT book.id, book.name, book.description,
+        COALESCE((
+            SELECT group_concat(author.name, ' ')
+            FROM {through} link
+            JOIN {author} author ON author.id = link.author_id
+            WHERE link.bookcatalog_id = book.id), ''),
+        category.name
+    FROM {book} book
+    JOIN {category} category ON category.id = book.category_id
+'''.format(
+    search=SEARCH_TABLE,
+    through=BookCatalog.author.through._meta.db_table,
+    author=Author._meta.db_table,
+    book=BookCatalog._meta.db_table,
+    category=Category._meta.db_table)
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def remove_books(book_ids):
+    book_ids = list(book_ids)
+    if not book_ids or not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0} WHERE rowid IN ({1})'.format(
+            SEARCH_TABLE, _placeholders(book_ids)), book_ids)
+
+
+def index_books(book_ids):
+    """(Re)index the given books, rows that no longer exist are dropped."""
+    book_ids = list(book_ids)
+    if not book_ids or not search_enabled():
+        return
+    remove_books(book_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(INDEX_SQL + ' WHERE book.id IN ({0})'.format(
+            _placeholders(book_ids)), book_ids)
+
+
+def index_book_range(first_id, last_id):
+    """Index new books with ids in [first_id, last_id], e.g. a bulk
+    import, without a parameter per book."""
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(INDEX_SQL + ' WHERE book.id BETWEEN %s AND %s',
+            [first_id, last_id])
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0}'.format(SEARCH_TABLE))
+        cursor.execute(INDEX_SQL)
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(
+            SEARCH_TABLE))
+
+
+def match_expression(query):
+    """FTS5 query for free text: every word has to match, the last one
+    as a prefix so results show up while the user is typing. Words are
+    quoted, FTS5 operators in the input are not interpreted."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join('"{0}"'.format(word) for word in words) + '*'
+
+
+class SearchResults(object):
+    __doc__ = """BM25 ranked search hits, lazily sliced so the
+    paginator only loads the books of the requested page"""
+
+    def __init__(self, query, queryset):
+        self.expression = match_expression(query)
+        self.queryset = queryset
+
+    def count(self):
+        if self.expression is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM {0} WHERE {0} MATCH %s'
+                .format(SEARCH_TABLE), [self.expression])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('SearchResults only support slicing')
+        if self.expression is None:
+            return []
+        offset = index.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {0} WHERE {0} MATCH %s ORDER BY {1} '
+                'LIMIT %s OFFSET %s'.format(SEARCH_TABLE, RANK),
+                [self.expression, index.stop - offset, offset])
+            book_ids = [row[0] for row in cursor.fetchall()]
+        books = self.queryset.in_bulk(book_ids)
+        return [books[book_id] for book_id in book_ids if book_id in books]
@@ -1,7 +1,34 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models import Exists, OuterRef
+
 from rest_framework import serializers
 
 from .models import (Category, Author, BookCatalog,
-    Review, ReadersTracker)
+    Review, ReadersTracker, BookUpload, BookStats)
+from .tasks import thumbnail_urls
+
+
+def stats_value(instance, name, default=0):
+    """Counter of the denormalized stats row of `instance`."""
+    try:
+        return getattr(instance.stats, name)
+    except ObjectDoesNotExist:
+        return default
+
+
+def cover_urls(instance, request=None):
+    """{size: {format: url}} of the cover thumbnails, None until they
+    are generated for the current cover."""
+    cover = instance.book_cover.name
+    if not cover or instance.thumbnail_source != cover:
+        return None
+    urls = thumbnail_urls(cover)
+    if request is not None:
+        urls = {size: {extension: request.build_absolute_uri(url)
+            for extension, url in formats.items()}
+            for size, formats in urls.items()}
+    return urls
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -14,7 +41,7 @@ class AuthorSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_book_count(self, instance):
-        return instance.books.all().count()
+        return stats_value(instance, 'book_count')
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -27,7 +54,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_book_count(self, instance):
-        return instance.books.all().count()
+        return stats_value(instance, 'book_count')
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -62,42 +89,134 @@ class PostReadersTrackerSerializer(serializers.ModelSerializer):
         return tracker
 
 
+class ProgressSerializer(serializers.Serializer):
+    __doc__ = """reading progress heartbeat, the book is checked when
+    the buffered update is written"""
+
+    book = serializers.IntegerField(min_value=1)
+    percent = serializers.IntegerField(min_value=0, max_value=100)
+
+
+class SyncProgressSerializer(ProgressSerializer):
+    __doc__ = """progress recorded offline, replayed in bulk"""
+
+    client_timestamp = serializers.DateTimeField(required=False)
+
+
+EXPANDABLE_BOOK_FIELDS = ('author', 'category', 'reviews')
+BOOK_STATS_FIELDS = ('review_count',)
+
+
+def _query_list(params, name):
+    return {value.strip() for value in params.get(name, '').split(',')
+        if value.strip()}
+
+
+def requested_fieldset(request):
+    """`(fields, expand)` asked for with ?fields= and ?expand=, or None
+    for the full legacy payload. An empty `fields` keeps every field;
+    relations missing from `expand` are rendered as primary keys."""
+    params = getattr(request, 'query_params', {})
+    if 'fields' not in params and 'expand' not in params:
+        return None
+    return _query_list(params, 'fields'), _query_list(params, 'expand')
+
+
+def reviewable_book_ids(request, book_ids):
+    """Books the requesting user finished reading and has not reviewed
+    yet, resolved for all of `book_ids` with a single query."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or not book_ids:
+        return set()
+
+    reviewed = Review.objects.filter(
+        book_id=OuterRef('book_id'), reader_id=user.id)
+    return set(ReadersTracker.objects.filter(
+        reader_id=user.id, book_id__in=book_ids, percent=100)
+        .annotate(reviewed=Exists(reviewed))
+        .filter(reviewed=False)
+        .values_list('book_id', flat=True))
+
+
+class CanReviewListSerializer(serializers.ListSerializer):
+    __doc__ = """Works out can_review for the whole page at once and
+    shares the result with the child serializers through the context"""
+
+    book_id_attr = 'id'
+
+    def get_book_fields(self):
+        return self.child.fields
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        iterable = list(iterable)
+        if 'can_review' not in self.get_book_fields():
+            return super().to_representation(iterable)
+        self.context['reviewable_books'] = reviewable_book_ids(
+            self.context.get('request'),
+            [getattr(item, self.book_id_attr) for item in iterable])
+        return super().to_representation(iterable)
+
+
 class GetBookCatalogSerializer(serializers.ModelSerializer):
     __doc__ = 'Book Catalog serializer'
 
     author = AuthorSerializer(read_only=True, many=True)
     category = CategorySerializer(read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    reviews = ReviewSerializer(source='latest_reviews',
+        many=True, read_only=True)
+    review_count = serializers.SerializerMethodField()
     can_review = serializers.SerializerMethodField()
+    cover_urls = serializers.SerializerMethodField()
 
     class Meta:
         model = BookCatalog
         fields = ('id', 'category', 'author',
-            'name', 'book_cover', 'description',
-            'reviews', 'file', 'can_review', 'created', 'updated')
+            'name', 'book_cover', 'cover_urls', 'description', 'reviews',
+            'review_count', 'file', 'can_review', 'created', 'updated')
+        list_serializer_class = CanReviewListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = requested_fieldset(self.context.get('request'))
+        if fieldset is None:
+            return
+
+        fields, expand = fieldset
+        for name in list(self.fields):
+            if fields and name not in fields and name != 'id':
+                self.fields.pop(name)
+        for name in EXPANDABLE_BOOK_FIELDS:
+            if name in self.fields and name not in expand:
+                source = self.fields[name].source
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, many=name != 'category',
+                    **({} if source == name else {'source': source}))
+
+    def get_review_count(self, instance):
+        return stats_value(instance, 'review_count')
 
     def get_can_review(self, instance):
-        try:
-            user = self.context['request'].user
-        except:
-            return False
+        reviewable = self.context.get('reviewable_books')
+        if reviewable is None:
+            reviewable = reviewable_book_ids(
+                self.context.get('request'), [instance.id])
+        return instance.id in reviewable
+
+    def get_cover_urls(self, instance):
+        return cover_urls(instance, self.context.get('request'))
 
-        try:
-            tracker = ReadersTracker.objects.get(
-                book__id=instance.id,
-                reader__id=user.id)
 
-        except ReadersTracker.DoesNotExist:
-            return False
+class BookStatsSerializer(serializers.ModelSerializer):
+    __doc__ = """Reader counters of a book. They move with every tracker,
+    so they are served apart from the cached catalog payload"""
 
-        if(tracker.percent == 100):
-            is_review = Review.objects.filter(
-                book__id=instance.id,
-                reader__id=user.id).exists()
+    completion_rate = serializers.ReadOnlyField()
 
-            if not is_review:
-                return True
-        return False
+    class Meta:
+        model = BookStats
+        fields = ('book', 'review_count', 'reader_count', 'completed_count',
+            'completion_rate')
 
 
 class PostBookCatalogSerializer(serializers.ModelSerializer):
@@ -112,6 +231,15 @@ class PostBookCatalogSerializer(serializers.ModelSerializer):
             'book_cover', 'description', 'file')
 
 
+class ReadersTrackerListSerializer(CanReviewListSerializer):
+    __doc__ = 'Resolves can_review of the tracked books of the page'
+
+    book_id_attr = 'book_id'
+
+    def get_book_fields(self):
+        return self.child.fields['book'].fields
+
+
 class GetReadersTrackerSerializer(serializers.ModelSerializer):
     __doc__ = 'Reader tracker serializer'
 
@@ -122,8 +250,56 @@ class GetReadersTrackerSerializer(serializers.ModelSerializer):
         model = ReadersTracker
         fields = ('id', 'book', 'reader', 'created',
             'updated', 'percent')
+        list_serializer_class = ReadersTrackerListSerializer
 
     def get_book(self, instance):
         serializer = GetBookCatalogSerializer(instance.book, 
             context={'request':self.context['request']})
-        return serializer.data
\ No newline at end of file
+        return serializer.data
+
+
+class BookSummarySerializer(serializers.ModelSerializer):
+    __doc__ = 'Compact book for shelves, names instead of nested objects'
+
+    category = serializers.StringRelatedField()
+    author = serializers.StringRelatedField(many=True)
+    cover_urls = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookCatalog
+        fields = ('id', 'name', 'book_cover', 'cover_urls', 'category',
+            'author')
+
+    def get_cover_urls(self, instance):
+        return cover_urls(instance, self.context.get('request'))
+
+
+class LibraryEntrySerializer(serializers.ModelSerializer):
+    __doc__ = 'Book of the reader library with the reading progress'
+
+    book = BookSummarySerializer()
+
+    class Meta:
+        model = ReadersTracker
+        fields = ('id', 'book', 'percent', 'created', 'updated')
+
+
+class BookUploadSerializer(serializers.ModelSerializer):
+    __doc__ = 'Resumable book file upload'
+
+    class Meta:
+        model = BookUpload
+        fields = ('id', 'book', 'filename', 'size', 'offset', 'sha256',
+            'completed', 'created', 'updated')
+        read_only_fields = ('offset', 'sha256', 'completed')
+
+    def validate_filename(self, value):
+        value = value.replace('\\', '/').rsplit('/', 1)[-1]
+        if '.' not in value.strip('.'):
+            raise serializers.ValidationError('Expected a file extension.')
+        return value
+
+    def validate_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError('Expected a positive size.')
+        return value
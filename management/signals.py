@@ -0,0 +1,238 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+    post_save, pre_delete)
+from django.dispatch import receiver
+
+from library.cache import bump_version
+from .models import (Category, Author, BookCatalog, Review, ReadersTracker,
+    BookStats, AuthorStats, CategoryStats)
+from . import blobs
+from . import search
+from . import stats
+
+
+CATALOG_CACHE = 'catalog'
+
+
+def reader_cache(user_id):
+    """Namespace of the per-user parts of catalog responses."""
+    return 'reader:{0}'.format(user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=BookCatalog)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=BookCatalog)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_version(CATALOG_CACHE)
+
+
+@receiver(m2m_changed, sender=BookCatalog.author.through)
+def invalidate_catalog_cache_authors(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version(CATALOG_CACHE)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=ReadersTracker)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=ReadersTracker)
+def invalidate_reader_cache(sender, instance, **kwargs):
+    bump_version(reader_cache(instance.reader_id))
+
+
+@receiver(post_save, sender=BookCatalog)
+def index_book(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_delete, sender=BookCatalog)
+def unindex_book(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def reindex_books(sender, instance, created, **kwargs):
+    if not created:
+        search.index_books(instance.books.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_books(sender, instance, **kwargs):
+    instance._search_book_ids = list(
+        instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def reindex_author_books(sender, instance, **kwargs):
+    search.index_books(getattr(instance, '_search_book_ids', ()))
+
+
+@receiver(m2m_changed, sender=BookCatalog.author.through)
+def reindex_book_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            search.index_books([instance.pk])
+    elif action == 'pre_clear':
+        instance._search_book_ids = list(
+            instance.books.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_books(getattr(instance, '_search_book_ids', ()))
+    elif action.startswith('post_'):
+        search.index_books(pk_set)
+
+
+# Stats counters. post_init remembers the values a save may change, read
+# from __dict__ so deferred fields are not loaded for it.
+
+@receiver(post_init, sender=BookCatalog)
+@receiver(post_init, sender=Review)
+@receiver(post_init, sender=ReadersTracker)
+def remember_stats_fields(sender, instance, **kwargs):
+    instance._stats_original = {name: instance.__dict__.get(name)
+        for name in ('category_id', 'book_id', 'percent')
+        if name in instance.__dict__}
+
+
+def _original(instance, name):
+    return getattr(instance, '_stats_original', {}).get(name)
+
+
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.create(category=instance)
+
+
+@receiver(post_save, sender=Author)
+def create_author_stats(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.create(author=instance)
+
+
+@receiver(post_save, sender=BookCatalog)
+def count_book(sender, instance, created, **kwargs):
+    previous = _original(instance, 'category_id')
+    if created:
+        BookStats.objects.create(book=instance)
+        stats.increment(CategoryStats, instance.category_id, book_count=1)
+    elif previous is not None and previous != instance.category_id:
+        stats.increment(CategoryStats, previous, book_count=-1)
+        stats.increment(CategoryStats, instance.category_id, book_count=1)
+    instance._stats_original['category_id'] = instance.category_id
+
+
+@receiver(pre_delete, sender=BookCatalog)
+def remember_book_authors(sender, instance, **kwargs):
+    # the M2M rows are removed without m2m_changed on delete
+    instance._stats_author_ids = list(
+        instance.author.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=BookCatalog)
+def uncount_book(sender, instance, **kwargs):
+    stats.increment(CategoryStats, instance.category_id, book_count=-1)
+    for author_id in getattr(instance, '_stats_author_ids', ()):
+        stats.increment(AuthorStats, author_id, book_count=-1)
+
+
+@receiver(m2m_changed, sender=BookCatalog.author.through)
+def count_book_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._stats_cleared = list((instance.books if reverse
+            else instance.author).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    delta = 1 if action == 'post_add' else -1
+    if action == 'post_clear':
+        pk_set = instance._stats_cleared
+    if reverse:
+        stats.increment(AuthorStats, instance.pk,
+            book_count=delta * len(pk_set))
+    else:
+        for author_id in pk_set:
+            stats.increment(AuthorStats, author_id, book_count=delta)
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    previous = _original(instance, 'book_id')
+    if created:
+        stats.increment(BookStats, instance.book_id, review_count=1)
+    elif previous is not None and previous != instance.book_id:
+        stats.increment(BookStats, previous, review_count=-1)
+        stats.increment(BookStats, instance.book_id, review_count=1)
+    instance._stats_original['book_id'] = instance.book_id
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    stats.increment(BookStats, instance.book_id, review_count=-1)
+
+
+@receiver(post_save, sender=ReadersTracker)
+def count_reader(sender, instance, created, **kwargs):
+    book_id = _original(instance, 'book_id')
+    was_completed = _original(instance, 'percent') == 100
+    completed = instance.percent == 100
+
+    if created:
+        stats.increment(BookStats, instance.book_id,
+            reader_count=1, completed_count=int(completed))
+    elif book_id is not None and book_id != instance.book_id:
+        stats.increment(BookStats, book_id,
+            reader_count=-1, completed_count=-int(was_completed))
+        stats.increment(BookStats, instance.book_id,
+            reader_count=1, completed_count=int(completed))
+    elif was_completed != completed:
+        stats.increment(BookStats, instance.book_id,
+            completed_count=1 if completed else -1)
+    else:
+        return
+    instance._stats_original.update(
+        book_id=instance.book_id, percent=instance.percent)
+
+
+@receiver(post_delete, sender=ReadersTracker)
+def uncount_reader(sender, instance, **kwargs):
+    stats.increment(BookStats, instance.book_id, reader_count=-1,
+        completed_count=-int(instance.percent == 100))
+
+
+# Content addressed files, see blobs. Deferred file fields are not
+# remembered, their references cannot have changed without loading them.
+
+def _blob_names(instance):
+    return {name: getattr(instance.__dict__[name], 'name',
+        instance.__dict__[name]) for name in blobs.BLOB_FIELDS
+        if name in instance.__dict__}
+
+
+@receiver(post_init, sender=BookCatalog)
+def remember_blob_fields(sender, instance, **kwargs):
+    instance._blob_original = _blob_names(instance)
+
+
+@receiver(post_save, sender=BookCatalog)
+def reference_blobs(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_blob_original', {})
+    current = _blob_names(instance)
+    for field, name in current.items():
+        if created:
+            blobs.reference(name, 1)
+        elif field in previous and previous[field] != name:
+            blobs.reference(previous[field], -1)
+            blobs.reference(name, 1)
+    instance._blob_original = current
+
+
+@receiver(post_delete, sender=BookCatalog)
+def unreference_blobs(sender, instance, **kwargs):
+    for name in _blob_names(instance).values():
+        blobs.reference(name, -1)
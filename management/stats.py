@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import (Category, Author, BookCatalog, Review, ReadersTracker,
+    BookStats, AuthorStats, CategoryStats)
+
+
+def _repair(model, expected):
+    """Create or fix the `model` rows of `expected`, a map of primary key
+    to counter values. Returns the number of rows that drifted."""
+    current = model.objects.in_bulk(list(expected))
+    missing, changed = [], []
+    for pk, values in expected.items():
+        row = current.get(pk)
+        if row is None:
+            missing.append(model(pk=pk, **values))
+        elif any(getattr(row, name) != value
+                for name, value in values.items()):
+            for name, value in values.items():
+                setattr(row, name, value)
+            changed.append(row)
+
+    model.objects.bulk_create(missing, batch_size=500)
+    if changed:
+        fields = [name for name in expected[changed[0].pk]]
+        model.objects.bulk_update(changed, fields, batch_size=500)
+    return len(missing) + len(changed)
+
+
+def reconcile_books(book_ids):
+    book_ids = list(BookCatalog.objects.filter(
+        pk__in=book_ids).values_list('pk', flat=True))
+    expected = {pk: {'review_count': 0, 'reader_count': 0,
+        'completed_count': 0} for pk in book_ids}
+
+    reviews = Review.objects.filter(book_id__in=book_ids).order_by()
+    for row in reviews.values('book_id').annotate(total=Count('pk')):
+        expected[row['book_id']]['review_count'] = row['total']
+
+    trackers = ReadersTracker.objects.filter(book_id__in=book_ids).order_by()
+    for row in trackers.values('book_id').annotate(
+            readers=Count('pk'), completed=Count('pk', filter=Q(percent=100))):
+        expected[row['book_id']].update(
+            reader_count=row['readers'], completed_count=row['completed'])
+    return _repair(BookStats, expected)
+
+
+def reconcile_authors(author_ids):
+    author_ids = list(Author.objects.filter(
+        pk__in=author_ids).values_list('pk', flat=True))
+    expected = {pk: {'book_count': 0} for pk in author_ids}
+
+    links = BookCatalog.author.through.objects.filter(
+        author_id__in=author_ids).order_by()
+    for row in links.values('author_id').annotate(total=Count('pk')):
+        expected[row['author_id']]['book_count'] = row['total']
+    return _repair(AuthorStats, expected)
+
+
+def reconcile_categories(category_ids):
+    category_ids = list(Category.objects.filter(
+        pk__in=category_ids).values_list('pk', flat=True))
+    expected = {pk: {'book_count': 0} for pk in category_ids}
+
+    books = BookCatalog.objects.filter(category_id__in=category_ids).order_by()
+    for row in books.values('category_id').annotate(total=Count('pk')):
+        expected[row['category_id']]['book_count'] = row['total']
+    return _repair(CategoryStats, expected)
+
+
+RECONCILERS = (
+    (BookCatalog, reconcile_books),
+    (Author, reconcile_authors),
+    (Category, reconcile_categories),
+)
+
+STATS_OWNERS = {
+    BookStats: reconcile_books,
+    AuthorStats: reconcile_authors,
+    CategoryStats: reconcile_categories,
+}
+
+
+def reconcile(batch_size=5000):
+    """Repair every stats row, in batches of `batch_size` owners. Returns
+    the number of drifted rows per owner model."""
+    repaired = {}
+    for owner, reconcile_batch in RECONCILERS:
+        repaired[owner.__name__] = 0
+        ids = owner.objects.order_by('pk').values_list('pk', flat=True)
+        batch = []
+        for pk in ids.iterator(chunk_size=batch_size):
+            batch.append(pk)
+            if len(batch) == batch_size:
+                with transaction.atomic():
+                    repaired[owner.__name__] += reconcile_batch(batch)
+                batch = []
+        with transaction.atomic():
+            repaired[owner.__name__] += reconcile_batch(batch)
+    return repaired
+
+
+def increment(model, pk, **deltas):
+    """Atomic F() update of the counters of one stats row. A missing row
+    is rebuilt once the transaction commits, if its owner still exists:
+    rebuilding it right away could recreate a row that a cascading
+    delete already removed."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas or pk is None:
+        return
+    updated = model.objects.filter(pk=pk).update(
+        **{name: F(name) + delta for name, delta in deltas.items()})
+    if not updated:
+        transaction.on_commit(lambda: STATS_OWNERS[model]([pk]))
+
+
+def increment_many(model, name, deltas, batch_size=500):
+    """increment() of one counter on many rows, `deltas` maps primary
+    keys to amounts. Rows are grouped by amount, a bulk import is a
+    handful of UPDATEs."""
+    groups = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            groups[delta].append(pk)
+    for delta, pks in groups.items():
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            updated = model.objects.filter(pk__in=batch).update(
+                **{name: F(name) + delta})
+            if updated != len(batch):
+                transaction.on_commit(
+                    lambda batch=batch: STATS_OWNERS[model](batch))
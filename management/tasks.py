@@ -0,0 +1,79 @@
+import hashlib
+import io
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from celery import shared_task
+
+from library.cache import bump_version
+from .models import BookCatalog
+from .signals import CATALOG_CACHE
+
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def has_uploaded_cover(name):
+    # the default cover lives outside MEDIA_ROOT
+    return bool(name) and not name.startswith('../')
+
+
+def thumbnail_name(cover_name, size, extension):
+    """Storage name of a thumbnail, derived from the cover name only so
+    it is known without touching the storage."""
+    digest = hashlib.md5(cover_name.encode()).hexdigest()
+    return 'thumbnails/{0}/{1}/{2}.{3}'.format(
+        digest[:2], digest, size, extension)
+
+
+def thumbnail_urls(cover_name):
+    return {size: {extension: default_storage.url(
+        thumbnail_name(cover_name, size, extension))
+        for extension in settings.COVER_THUMBNAIL_FORMATS}
+        for size in settings.COVER_THUMBNAIL_SIZES}
+
+
+def render_thumbnails(cover_name):
+    """Write every size and encoding of a cover, returns the cover name.
+    Touches the storage only, so it can run in a worker process."""
+    with default_storage.open(cover_name, 'rb') as stream:
+        image = Image.open(stream)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    for size, box in settings.COVER_THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(box, Image.LANCZOS)
+        for extension in settings.COVER_THUMBNAIL_FORMATS:
+            content = io.BytesIO()
+            thumbnail.save(content, PIL_FORMATS[extension],
+                quality=settings.COVER_THUMBNAIL_QUALITY,
+                optimize=True, progressive=True)
+            name = thumbnail_name(cover_name, size, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(content.getvalue()))
+    return cover_name
+
+
+def mark_thumbnails(book_id, cover_name):
+    """Record the thumbnails unless the cover changed in the meantime."""
+    updated = BookCatalog.objects.filter(
+        pk=book_id, book_cover=cover_name).update(thumbnail_source=cover_name)
+    if updated:
+        bump_version(CATALOG_CACHE)
+    return updated
+
+
+@shared_task(ignore_result=True)
+def generate_cover_thumbnails(book_id):
+    cover_name = BookCatalog.objects.filter(pk=book_id).values_list(
+        'book_cover', flat=True).first()
+    if not has_uploaded_cover(cover_name):
+        return
+    render_thumbnails(cover_name)
+    mark_thumbnails(book_id, cover_name)
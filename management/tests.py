@@ -1,21 +1,50 @@
+import errno
+import hashlib
+import io
+import json
+import os
+import sqlite3
 import tempfile
+import uuid
 from PIL import Image
 from datetime import datetime, timedelta, date, time
 from faker import Faker
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login
+from django.db import connection, IntegrityError, transaction
+from django.core.management import call_command
+from django.test import (RequestFactory, TransactionTestCase,
+    override_settings)
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from django.utils import timezone
 
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
 from rest_framework.test import APITestCase
 from rest_framework.test import RequestsClient
 
 from management.models import (Category, Author, BookCatalog,
-    Review, ReadersTracker)
+    Review, ReadersTracker, BookStats, AuthorStats, CategoryStats, BookUpload,
+    StoredBlob)
+from management import uploads
+from management.benchmark import dataset, run, seed
+from management.blobs import collect_garbage, recount
+from management.mixins import CachedReadMixin
+from library.cache import get_version
+from library.routers import ReplicaMiddleware, ReplicaRouter, primary_reads
+from library.storage import cas_storage, serve_immutable
+from management.stats import reconcile
+from management.tasks import generate_cover_thumbnails, thumbnail_name
+from management.progress import ProgressBuffer, apply_progress, progress_buffer
+from management.signals import CATALOG_CACHE
+from users.authentication import CachedTokenAuthentication
 
 import tempfile
 
@@ -351,4 +380,1227 @@ class ReadersTrackerTest(AccountTests):
         response = self.client.delete(url, format='json')
         tracker_exist = ReadersTracker.objects.filter(pk=self.tracker.id).exists()
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertEqual(tracker_exist, False)
\ No newline at end of file
+        self.assertEqual(tracker_exist, False)
+
+class BookQueryCountTest(AccountTests):
+    __doc__ = """Book catalog read path runs a fixed number of queries."""
+
+    def setUp(self):
+        super().setUp()
+        # token lookups are cached, keep them out of the counts
+        for key in (self.token, self.admin_token):
+            CachedTokenAuthentication().authenticate_credentials(key)
+
+    def add_books(self, count, authors=3, reviews=3):
+        for index in range(count):
+            book = BookCatalog.objects.create(
+                name=fake.name(),
+                description=fake.text(),
+                category=self.category)
+            for author_index in range(authors):
+                book.author.add(Author.objects.create(name=fake.name()))
+            for review_index in range(reviews):
+                Review.objects.create(
+                    book=book, reader=self.user, review=fake.word())
+
+    def count_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_book_list_query_count(self):
+        url = reverse('bookcatalog-list')
+        expected = self.count_queries(url, {'page_size': 1})
+        self.add_books(12)
+        self.assertEqual(self.count_queries(url, {'page_size': 5}), expected)
+        self.assertEqual(self.count_queries(url, {'page_size': 20}), expected)
+
+    def test_book_get_query_count(self):
+        url = reverse('bookcatalog-detail', kwargs={'pk': self.book.id})
+        expected = self.count_queries(url)
+        for index in range(4):
+            self.book.author.add(Author.objects.create(name=fake.name()))
+            Review.objects.create(
+                book=self.book, reader=self.user, review=fake.word())
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_category_books_query_count(self):
+        url = reverse('category-books', kwargs={'pk': self.category.id})
+        expected = self.count_queries(url)
+        self.add_books(8)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_book_list_can_review(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        finished = BookCatalog.objects.create(
+            name='finished', category=self.category)
+        reviewed = BookCatalog.objects.create(
+            name='reviewed', category=self.category)
+        for book in (finished, reviewed):
+            ReadersTracker.objects.create(
+                book=book, reader=self.user, percent=100)
+        Review.objects.create(book=reviewed, reader=self.user, review='ok')
+
+        url = reverse('bookcatalog-list')
+        response = self.client.get(url, format='json')
+        can_review = {book['id']: book['can_review']
+            for book in response.data['data']}
+        self.assertEqual(can_review, {
+            finished.id: True, reviewed.id: False, self.book.id: False})
+
+    def test_tracker_list_query_count(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        url = reverse('readerstracker-list')
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=100)
+        expected = self.count_queries(url)
+        self.add_books(6, authors=1, reviews=0)
+        for book in BookCatalog.objects.exclude(pk=self.book.pk):
+            ReadersTracker.objects.create(
+                book=book, reader=self.user, percent=100)
+        self.assertEqual(self.count_queries(url), expected)
+
+
+class BookCursorPaginationTest(AccountTests):
+    __doc__ = """Keyset pagination mode of the book catalog list."""
+
+    def setUp(self):
+        super().setUp()
+        for index in range(4):
+            BookCatalog.objects.create(
+                name=fake.name(), category=self.category)
+
+    def collect_pages(self, data):
+        url = reverse('bookcatalog-list')
+        ids = []
+        response = self.client.get(url, data, format='json')
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIsNone(response.data['meta']['totalRecords'])
+            ids += [book['id'] for book in response.data['data']]
+            if not response.data['meta']['next']:
+                return ids
+            response = self.client.get(
+                response.data['meta']['next'], format='json')
+
+    def test_cursor_pages(self):
+        ids = self.collect_pages({'cursor': '', 'page_size': 2})
+        expected = list(BookCatalog.objects.order_by('-id')
+            .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_cursor_pages_by_updated(self):
+        ids = self.collect_pages(
+            {'cursor': '', 'page_size': 2, 'ordering': 'updated'})
+        expected = list(BookCatalog.objects.order_by('updated', 'id')
+            .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_cursor_count_on_request(self):
+        url = reverse('bookcatalog-list')
+        response = self.client.get(
+            url, {'cursor': '', 'count': 'true'}, format='json')
+        self.assertEqual(response.data['meta']['totalRecords'], 5)
+
+
+class ResponseCacheTest(AccountTests):
+    __doc__ = """Versioned response cache of catalog reads."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookcatalog-list')
+
+    def test_book_list_served_from_cache(self):
+        response = self.client.get(self.url, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, format='json')
+        self.assertEqual(cached.data['data'], response.data['data'])
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('"management_bookcatalog"."name"', sql)
+
+    def test_book_list_invalidated_on_change(self):
+        self.client.get(self.url, format='json')
+        self.book.name = 'book1-renamed'
+        self.book.save()
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data['data'][0]['name'], 'book1-renamed')
+
+        self.book.author.add(Author.objects.create(name='author2'))
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(len(response.data['data'][0]['author']), 2)
+
+    def test_can_review_not_shared(self):
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=100)
+        response = self.client.get(self.url, format='json')
+        self.assertFalse(response.data['data'][0]['can_review'])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get(self.url, format='json')
+        self.assertTrue(response.data['data'][0]['can_review'])
+
+
+class ConditionalGetTest(AccountTests):
+    __doc__ = """ETag / Last-Modified handling of book catalog reads."""
+
+    def setUp(self):
+        super().setUp()
+        self.list_url = reverse('bookcatalog-list')
+        self.detail_url = reverse(
+            'bookcatalog-detail', kwargs={'pk': self.book.id})
+
+    def test_etag_not_modified(self):
+        for url in (self.list_url, self.detail_url):
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, format='json',
+                    HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(
+                response.status_code, status.HTTP_304_NOT_MODIFIED)
+            # the validator aggregate only, the token is cached
+            self.assertEqual(len(queries), 1)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.list_url, format='json')
+        response = self.client.get(self.list_url, format='json',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_with_catalog(self):
+        etag = self.client.get(self.list_url, format='json')['ETag']
+        Review.objects.create(book=self.book, reader=self.user, review='ok')
+        response = self.client.get(self.list_url, format='json',
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_follows_deletes_and_renames(self):
+        other = BookCatalog.objects.create(
+            name='other', category=self.category)
+
+        def rename():
+            self.author.name = 'renamed'
+            self.author.save()
+
+        for later, change in ((5, other.delete), (10, rename)):
+            last_modified = self.client.get(
+                self.list_url, format='json')['Last-Modified']
+            # a later second than the copy the client holds
+            with mock.patch('library.cache.time.time',
+                    return_value=timezone.now().timestamp() + later):
+                change()
+            response = self.client.get(self.list_url, format='json',
+                HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_pk_not_found(self):
+        response = self.client.get('/api/book-catalog/abc/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsetTest(AccountTests):
+    __doc__ = """?fields= and ?expand= on the book catalog."""
+
+    def setUp(self):
+        super().setUp()
+
+    def test_sparse_fields(self):
+        url = reverse('bookcatalog-list')
+        response = self.client.get(url, {'fields': 'name,book_cover'})
+        self.assertEqual(set(response.data['data'][0]),
+            {'id', 'name', 'book_cover'})
+
+    def test_relations_collapsed_unless_expanded(self):
+        url = reverse('bookcatalog-detail', kwargs={'pk': self.book.id})
+        response = self.client.get(url, {'expand': 'author'})
+        self.assertEqual(response.data['category'], self.category.id)
+        self.assertEqual(response.data['reviews'], [])
+        self.assertEqual(response.data['author'][0]['book_count'], 1)
+
+        response = self.client.get(url, {'fields': 'author', 'expand': ''})
+        self.assertEqual(response.data['author'], [self.author.id])
+
+    def test_sparse_fields_query_count(self):
+        url = reverse('bookcatalog-list')
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get(url, {'fields': 'name'})
+        self.assertLess(len(sparse), len(full))
+
+    def test_category_books_fields(self):
+        url = reverse('category-books', kwargs={'pk': self.category.id})
+        response = self.client.get(url, {'fields': 'name'})
+        self.assertEqual(set(response.data[0]), {'id', 'name'})
+
+
+class BookReviewsTest(AccountTests):
+    __doc__ = """Latest reviews on books and the paginated reviews action."""
+
+    def setUp(self):
+        super().setUp()
+        for index in range(settings.BOOK_LATEST_REVIEWS + 3):
+            Review.objects.create(
+                book=self.book, reader=self.user, review=fake.word())
+
+    def test_book_latest_reviews(self):
+        url = reverse('bookcatalog-detail', kwargs={'pk': self.book.id})
+        response = self.client.get(url, format='json')
+        latest = Review.objects.filter(book=self.book).order_by('-id')
+        self.assertEqual(response.data['review_count'], latest.count())
+        self.assertEqual([review['id'] for review in response.data['reviews']],
+            [review.id for review in latest[:settings.BOOK_LATEST_REVIEWS]])
+
+    def test_book_reviews_paginated(self):
+        url = reverse('bookcatalog-reviews', kwargs={'pk': self.book.id})
+        response = self.client.get(url, {'page': 2, 'page_size': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['meta']['totalRecords'],
+            settings.BOOK_LATEST_REVIEWS + 3)
+        self.assertEqual(len(response.data['data']),
+            settings.BOOK_LATEST_REVIEWS + 3 - 5)
+        self.assertEqual(response.data['data'][0]['book_name'], 'book1')
+
+    def test_book_reviews_cursor_by_created(self):
+        # ids and creation times disagree, the cursor follows `created`
+        reviews = list(Review.objects.order_by('id'))
+        for index, review in enumerate(reviews):
+            Review.objects.filter(pk=review.pk).update(
+                created=timezone.now() - timedelta(hours=index))
+        url = reverse('bookcatalog-reviews', kwargs={'pk': self.book.id})
+        response = self.client.get(url, {'cursor': '', 'page_size': 100})
+        self.assertEqual([review['id'] for review in response.data['data']],
+            [review.id for review in reviews])
+        response = self.client.get(url, {'page_size': 100})
+        self.assertEqual([review['id'] for review in response.data['data']],
+            [review.id for review in reviews])
+
+
+class BookSearchTest(AccountTests):
+    __doc__ = """Full text search over the book catalog."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookcatalog-search')
+        self.dune = BookCatalog.objects.create(
+            name='Dune', description='desert planet', category=self.category)
+        self.dune.author.add(Author.objects.create(name='Frank Herbert'))
+        self.other = BookCatalog.objects.create(
+            name='Sands', description='a dune guide', category=self.category)
+
+    def search(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['id'] for book in response.data['data']]
+
+    def test_search_ranked(self):
+        self.assertEqual(self.search('dune'), [self.dune.id, self.other.id])
+        self.assertEqual(self.search('herb'), [self.dune.id])
+        self.assertEqual(self.search('category1 desert'), [self.dune.id])
+
+    def test_search_index_follows_changes(self):
+        self.category.name = 'science fiction'
+        self.category.save()
+        self.assertEqual(len(self.search('fiction')), 3)
+
+        Author.objects.filter(name='Frank Herbert').delete()
+        self.assertEqual(self.search('herbert'), [])
+
+        self.dune.delete()
+        self.assertEqual(self.search('dune'), [self.other.id])
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url, {'q': ' '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookFilterTest(AccountTests):
+    __doc__ = """Faceted filtering of the book catalog list."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookcatalog-list')
+        self.category2 = Category.objects.create(name='category2')
+        self.author2 = Author.objects.create(name='author2')
+        self.book2 = BookCatalog.objects.create(
+            name='book2', category=self.category2)
+        self.book2.author.add(self.author, self.author2)
+        self.book3 = BookCatalog.objects.create(
+            name='book3', category=self.category2)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {book['id'] for book in response.data['data']}
+
+    def test_filter_category_and_author(self):
+        response = self.client.get(self.url, {'category': self.category2.id})
+        self.assertEqual(self.ids(response), {self.book2.id, self.book3.id})
+
+        response = self.client.get(self.url, {
+            'category': self.category2.id, 'author': self.author.id})
+        self.assertEqual(self.ids(response), {self.book2.id})
+
+        response = self.client.get(self.url, {
+            'author': '{0},{1}'.format(self.author.id, self.author2.id)})
+        self.assertEqual(self.ids(response), {self.book.id, self.book2.id})
+
+    def test_filter_created_range(self):
+        BookCatalog.objects.filter(pk=self.book.pk).update(
+            created=datetime(2019, 1, 1, tzinfo=timezone.utc))
+        response = self.client.get(self.url, {'created_before': '2019-06-01'})
+        self.assertEqual(self.ids(response), {self.book.id})
+        response = self.client.get(self.url, {'created_after': '2019-06-01'})
+        self.assertEqual(self.ids(response), {self.book2.id, self.book3.id})
+
+        response = self.client.get(self.url, {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets(self):
+        response = self.client.get(self.url, {'category': self.category2.id})
+        facets = response.data['meta']['facets']
+        self.assertEqual(
+            {row['id']: row['count'] for row in facets['category']},
+            {self.category.id: 1, self.category2.id: 2})
+        self.assertEqual(
+            {row['id']: row['count'] for row in facets['author']},
+            {self.author.id: 1, self.author2.id: 1})
+
+        response = self.client.get(self.url)
+        self.assertNotIn('facets', response.data['meta'])
+
+
+class StatsTest(AccountTests):
+    __doc__ = """Denormalized book, author and category counters."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookcatalog-detail', kwargs={'pk': self.book.id})
+
+    def test_counters_follow_changes(self):
+        book = BookCatalog.objects.create(name='book2', category=self.category)
+        book.author.add(self.author)
+        self.assertEqual(CategoryStats.objects.get(
+            pk=self.category.pk).book_count, 2)
+        self.assertEqual(AuthorStats.objects.get(
+            pk=self.author.pk).book_count, 2)
+
+        book.delete()
+        self.assertEqual(CategoryStats.objects.get(
+            pk=self.category.pk).book_count, 1)
+        self.assertEqual(AuthorStats.objects.get(
+            pk=self.author.pk).book_count, 1)
+
+        tracker = ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=50)
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.admin, percent=100)
+        Review.objects.create(book=self.book, reader=self.user, review='ok')
+        tracker.percent = 100
+        tracker.save()
+
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data['review_count'], 1)
+        self.assertEqual(response.data['author'][0]['book_count'], 1)
+        self.assertEqual(response.data['category']['book_count'], 1)
+
+        response = self.client.get(reverse('bookcatalog-stats',
+            kwargs={'pk': self.book.id}), format='json')
+        self.assertEqual(response.data['reader_count'], 2)
+        self.assertEqual(response.data['completed_count'], 2)
+        self.assertEqual(response.data['completion_rate'], 1.0)
+
+    def test_reader_counters_keep_the_catalog_cache(self):
+        version = get_version(CATALOG_CACHE)
+        tracker = ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=50)
+        tracker.percent = 100
+        tracker.save()
+        apply_progress({(self.admin.pk, self.book.pk): 100})
+        tracker.delete()
+        self.assertEqual(get_version(CATALOG_CACHE), version)
+
+        BookStats.objects.filter(pk=self.book.pk).delete()
+        response = self.client.get(reverse('bookcatalog-stats',
+            kwargs={'pk': self.book.id}), format='json')
+        self.assertEqual(response.data['reader_count'], 0)
+        response = self.client.get(reverse('bookcatalog-stats',
+            kwargs={'pk': 0}), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reconcile_repairs_drift(self):
+        BookStats.objects.filter(pk=self.book.pk).update(review_count=7)
+        CategoryStats.objects.filter(pk=self.category.pk).delete()
+        Review.objects.create(book=self.book, reader=self.user, review='ok')
+
+        repaired = reconcile()
+        self.assertEqual(repaired['BookCatalog'], 1)
+        self.assertEqual(repaired['Category'], 1)
+        self.assertEqual(BookStats.objects.get(
+            pk=self.book.pk).review_count, 1)
+        self.assertEqual(CategoryStats.objects.get(
+            pk=self.category.pk).book_count, 1)
+
+
+class ProgressBufferTest(AccountTests):
+    __doc__ = """Write-behind reading progress."""
+
+    def test_buffer_coalesces_to_max(self):
+        buffer = ProgressBuffer(max_size=2, interval=None)
+        buffer.add(self.user.pk, self.book.pk, 40)
+        buffer.add(self.user.pk, self.book.pk, 70)
+        buffer.add(self.user.pk, self.book.pk, 20)
+        self.assertFalse(ReadersTracker.objects.exists())
+
+        # a second key fills the buffer
+        buffer.add(self.admin.pk, self.book.pk, 100)
+        self.assertEqual(dict(ReadersTracker.objects.values_list(
+            'reader_id', 'percent')), {self.user.pk: 70, self.admin.pk: 100})
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_apply_progress_never_lowers(self):
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=60)
+        results = apply_progress({
+            (self.user.pk, self.book.pk): 30,
+            (self.admin.pk, self.book.pk): 100,
+            (self.user.pk, 0): 10,
+        })
+        self.assertEqual(results[(self.user.pk, self.book.pk)],
+            {'percent': 60, 'status': 'unchanged'})
+        self.assertEqual(results[(self.admin.pk, self.book.pk)]['status'],
+            'created')
+        self.assertEqual(results[(self.user.pk, 0)]['status'], 'invalid')
+
+        results = apply_progress({(self.user.pk, self.book.pk): 100})
+        self.assertEqual(results[(self.user.pk, self.book.pk)]['status'],
+            'updated')
+        stats = BookStats.objects.get(pk=self.book.pk)
+        self.assertEqual(stats.reader_count, 2)
+        self.assertEqual(stats.completed_count, 2)
+
+    def test_progress_endpoint(self):
+        url = reverse('readerstracker-progress')
+        data = {'book': self.book.pk, 'percent': 80}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        progress_buffer.flush()
+        self.assertEqual(ReadersTracker.objects.get(
+            book=self.book, reader=self.admin).percent, 80)
+
+        response = self.client.post(
+            url, {'book': self.book.pk, 'percent': 101}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_offline_progress(self):
+        book = BookCatalog.objects.create(name='book2', category=self.category)
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.admin, percent=90)
+        data = [
+            {'book': self.book.pk, 'percent': 50,
+                'client_timestamp': '2026-10-01T10:00:00Z'},
+            {'book': book.pk, 'percent': 30},
+            {'book': book.pk, 'percent': 100},
+            {'book': 0, 'percent': 10},
+            {'book': book.pk, 'percent': 'x'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('readerstracker-sync'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in response.data['data']],
+            ['unchanged', 'created', 'created', 'invalid', 'invalid'])
+        self.assertEqual(response.data['data'][0]['percent'], 90)
+        self.assertIn('percent', response.data['data'][4]['errors'])
+        self.assertEqual(ReadersTracker.objects.get(
+            book=book, reader=self.admin).percent, 100)
+        self.assertLessEqual(len(queries), 10)
+
+        response = self.client.post(reverse('readerstracker-sync'),
+            {'book': book.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_dates_trackers_by_client_timestamp(self):
+        books = [BookCatalog.objects.create(name='book{0}'.format(number),
+            category=self.category) for number in range(2, 5)]
+        read = timezone.now() - timedelta(days=3)
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.admin, percent=10)
+        ReadersTracker.objects.update(updated=read - timedelta(days=2))
+        data = [
+            {'book': self.book.pk, 'percent': 50,
+                'client_timestamp': read.isoformat()},
+            {'book': books[0].pk, 'percent': 20,
+                'client_timestamp': (read - timedelta(days=1)).isoformat()},
+            {'book': books[0].pk, 'percent': 30,
+                'client_timestamp': read.isoformat()},
+            {'book': books[1].pk, 'percent': 40,
+                'client_timestamp': (read + timedelta(days=30)).isoformat()},
+            {'book': books[2].pk, 'percent': 50},
+        ]
+        started = timezone.now()
+        response = self.client.post(
+            reverse('readerstracker-sync'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updated = dict(ReadersTracker.objects.filter(
+            reader=self.admin).values_list('book_id', 'updated'))
+        self.assertEqual(updated[self.book.pk], read)
+        # a replay older than the tracker does not move it back
+        apply_progress({(self.admin.pk, self.book.pk): 60},
+            {(self.admin.pk, self.book.pk): read - timedelta(days=1)})
+        self.assertEqual(ReadersTracker.objects.get(
+            book=self.book, reader=self.admin).updated, read)
+        # the latest timestamp of a book wins
+        self.assertEqual(updated[books[0].pk], read)
+        # a clock in the future is clamped to now
+        self.assertGreaterEqual(updated[books[1].pk], started)
+        self.assertLessEqual(updated[books[1].pk], timezone.now())
+        self.assertGreaterEqual(updated[books[2].pk], started)
+
+
+class MyLibraryTest(AccountTests):
+    __doc__ = """Library of the current reader."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('my-library-list')
+        self.books = [BookCatalog.objects.create(
+            name='book{0}'.format(number), category=self.category)
+            for number in range(2, 5)]
+        for book in self.books:
+            book.author.add(self.author)
+            ReadersTracker.objects.create(
+                book=book, reader=self.admin, percent=10)
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=10)
+        tracker = ReadersTracker.objects.get(
+            book=self.books[0], reader=self.admin)
+        tracker.percent = 50
+        tracker.save()
+
+    def test_library_scoped_and_recent_first(self):
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['book']['id'] for entry in response.data['data']],
+            [self.books[0].id, self.books[2].id, self.books[1].id])
+        self.assertEqual(response.data['data'][0]['book']['author'],
+            ['author1'])
+        self.assertEqual(response.data['data'][0]['book']['category'],
+            'category1')
+
+        response = self.client.get(self.url + '?ordering=updated&cursor=',
+            format='json')
+        self.assertEqual([entry['book']['id'] for entry in response.data['data']],
+            [self.books[1].id, self.books[2].id, self.books[0].id])
+
+    def test_library_query_count(self):
+        CachedTokenAuthentication().authenticate_credentials(self.admin_token)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, format='json')
+        for number in range(5, 15):
+            book = BookCatalog.objects.create(
+                name='book{0}'.format(number), category=self.category)
+            book.author.add(self.author)
+            ReadersTracker.objects.create(book=book, reader=self.admin)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get(self.url, format='json')
+        self.assertEqual(len(queries), len(more_queries))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+class LookupIndexTest(AccountTests):
+    __doc__ = """EXPLAIN QUERY PLAN of the hot lookups."""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn('USING INDEX {0}'.format(index), plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_tracker_by_book_and_reader(self):
+        self.assertUsesIndex(ReadersTracker.objects.filter(
+            book=self.book, reader=self.user),
+            'sqlite_autoindex_management_readerstracker_1 '
+            '(book_id=? AND reader_id=?)')
+
+    def test_review_by_book_and_reader(self):
+        self.assertUsesIndex(Review.objects.filter(
+            book=self.book, reader=self.user), 'review_book_reader_idx')
+
+    def test_library_by_updated(self):
+        for ordering in (('-updated', '-id'), ('updated', 'id')):
+            self.assertUsesIndex(ReadersTracker.objects.filter(
+                reader=self.user).order_by(*ordering)[:10],
+                'tracker_reader_updated_idx')
+
+    def test_category_books(self):
+        self.assertUsesIndex(BookCatalog.objects.filter(
+            category=self.category).order_by('-id')[:10],
+            'book_category_id_idx')
+
+    def test_tracker_unique(self):
+        ReadersTracker.objects.create(book=self.book, reader=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReadersTracker.objects.create(book=self.book, reader=self.user)
+
+
+class BookDownloadTest(AccountTests):
+    __doc__ = """Book file delivery with ranges."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(media.name, 'book_file'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(media.name, 'book_file', 'book1.pdf'), 'wb') as stream:
+            stream.write(self.content)
+        self.book.file = 'book_file/book1.pdf'
+        self.book.save()
+        self.url = reverse('bookcatalog-download', kwargs={'pk': self.book.id})
+
+    def test_download_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_download_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=300-599')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 300-599/10240')
+        self.assertEqual(b''.join(response.streaming_content),
+            self.content[300:600])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-100')
+        self.assertEqual(b''.join(response.streaming_content),
+            self.content[-100:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10240')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+            HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(BOOK_DOWNLOAD_MODE='x-accel-redirect')
+    def test_download_through_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+            '/protected-media/book_file/book1.pdf')
+        self.assertEqual(response.content, b'')
+
+
+class CoverThumbnailTest(AccountTests):
+    __doc__ = """Cover thumbnails."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(media.name, 'book_cover'))
+        Image.new('RGBA', (600, 900)).save(
+            os.path.join(media.name, 'book_cover', 'cover.png'))
+        self.book.book_cover = 'book_cover/cover.png'
+        self.book.save()
+        self.url = reverse('bookcatalog-detail', kwargs={'pk': self.book.id})
+
+    def test_generate_thumbnails(self):
+        response = self.client.get(self.url, format='json')
+        self.assertIsNone(response.data['cover_urls'])
+
+        generate_cover_thumbnails(self.book.pk)
+        for size, box in settings.COVER_THUMBNAIL_SIZES.items():
+            name = thumbnail_name('book_cover/cover.png', size, 'webp')
+            with Image.open(os.path.join(self.media, name)) as image:
+                self.assertEqual(image.size, box)
+
+        response = self.client.get(self.url, format='json')
+        self.assertTrue(response.data['cover_urls']['small']['jpeg'].endswith(
+            thumbnail_name('book_cover/cover.png', 'small', 'jpeg')))
+
+        response = self.client.get(self.url + '?fields=cover_urls',
+            format='json')
+        self.assertIn('webp', response.data['cover_urls']['large'])
+
+    def test_thumbnails_stale_after_cover_change(self):
+        generate_cover_thumbnails(self.book.pk)
+        self.book.refresh_from_db()
+        self.book.book_cover = 'book_cover/other.png'
+        self.book.save()
+        response = self.client.get(self.url, format='json')
+        self.assertIsNone(response.data['cover_urls'])
+
+    def test_generate_thumbnails_command(self):
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.thumbnail_source, 'book_cover/cover.png')
+
+
+class BookUploadTest(AccountTests):
+    __doc__ = """Resumable chunked book uploads."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name,
+            BOOK_UPLOAD_DIR=os.path.join(media.name, 'partial'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = os.urandom(300 * 1024)
+
+    def initiate(self):
+        response = self.client.post(reverse('bookupload-list'), {
+            'book': self.book.pk, 'filename': 'novel.pdf',
+            'size': len(self.content)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, upload_id, offset, chunk):
+        return self.client.put(
+            reverse('bookupload-chunk', kwargs={'pk': upload_id})
+            + '?offset={0}'.format(offset), chunk,
+            content_type='application/octet-stream')
+
+    def test_chunked_upload(self):
+        upload_id = self.initiate()
+        response = self.put_chunk(upload_id, 0, self.content[:100000])
+        self.assertEqual(response.data['offset'], 100000)
+
+        # a repeated chunk is refused with the offset to resume from
+        response = self.put_chunk(upload_id, 0, self.content[:100000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 100000)
+
+        response = self.put_chunk(upload_id, 100000, self.content[100000:])
+        self.assertEqual(response.data['offset'], len(self.content))
+
+        response = self.client.post(
+            reverse('bookupload-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['sha256'],
+            hashlib.sha256(self.content).hexdigest())
+        self.book.refresh_from_db()
+        with open(os.path.join(self.media, self.book.file.name), 'rb') as stream:
+            self.assertEqual(stream.read(), self.content)
+
+    def test_resume_in_new_process(self):
+        upload_id = self.initiate()
+        self.put_chunk(upload_id, 0, self.content[:5000])
+        # the running hash is lost, completing rehashes the partial file
+        uploads._hashers.clear()
+        self.put_chunk(upload_id, 5000, self.content[5000:])
+        response = self.client.post(
+            reverse('bookupload-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(response.data['sha256'],
+            hashlib.sha256(self.content).hexdigest())
+
+    def test_complete_across_devices(self):
+        upload_id = self.initiate()
+        self.put_chunk(upload_id, 0, self.content)
+        url = reverse('bookupload-complete', kwargs={'pk': upload_id})
+
+        with mock.patch('management.uploads.shutil.move',
+                side_effect=OSError('disk full')), \
+                mock.patch('management.uploads.os.replace',
+                side_effect=OSError(errno.EXDEV, 'cross-device link')):
+            with self.assertRaises(OSError):
+                self.client.post(url)
+        # not marked complete, the retry goes through
+        self.assertFalse(BookUpload.objects.get(pk=upload_id).completed)
+
+        replace = os.replace
+        def replace_across_devices(source, target):
+            if source.startswith(settings.BOOK_UPLOAD_DIR):
+                raise OSError(errno.EXDEV, 'cross-device link')
+            replace(source, target)
+        with mock.patch('management.uploads.os.replace',
+                side_effect=replace_across_devices):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.book.refresh_from_db()
+        with open(os.path.join(self.media, self.book.file.name), 'rb') as stream:
+            self.assertEqual(stream.read(), self.content)
+
+    def test_incomplete_and_oversized(self):
+        upload_id = self.initiate()
+        response = self.client.post(
+            reverse('bookupload-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.put_chunk(upload_id, 0, self.content + b'x')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(BookUpload.objects.get(pk=upload_id).offset, 0)
+
+
+class ContentAddressedStorageTest(AccountTests):
+    __doc__ = """Deduplicated book files with reference counts."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def add_book(self, content):
+        return BookCatalog.objects.create(name='copy', category=self.category,
+            file=SimpleUploadedFile('copy.pdf', content))
+
+    def test_same_content_stored_once(self):
+        first, second = self.add_book(b'pdf'), self.add_book(b'pdf')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.file.name, cas_storage.hashed_name(
+            hashlib.sha256(b'pdf').hexdigest(), '.pdf'))
+        self.assertEqual(StoredBlob.objects.get(
+            name=first.file.name).references, 2)
+        self.assertNotEqual(self.add_book(b'other').file.name, first.file.name)
+
+    def test_extension_of_dotted_and_bare_names(self):
+        digest = hashlib.sha256(b'pdf').hexdigest()
+        for filename, extension in (('vol.1.pdf', '.pdf'), ('README', '')):
+            book = BookCatalog.objects.create(name=filename,
+                category=self.category,
+                file=SimpleUploadedFile(filename, b'pdf'))
+            self.assertEqual(book.file.name,
+                cas_storage.hashed_name(digest, extension))
+
+    def test_garbage_collection(self):
+        first, second = self.add_book(b'pdf'), self.add_book(b'pdf')
+        name = first.file.name
+        first.delete()
+        self.assertEqual(collect_garbage(grace=timedelta(0)), [])
+
+        second.file = SimpleUploadedFile('new.pdf', b'new')
+        second.save()
+        self.assertEqual(StoredBlob.objects.get(name=name).references, 0)
+        self.assertEqual(collect_garbage(grace=timedelta(hours=1)), [])
+        self.assertEqual(collect_garbage(grace=timedelta(0)), [name])
+        self.assertFalse(cas_storage.exists(name))
+        self.assertTrue(cas_storage.exists(second.file.name))
+
+    def test_recount(self):
+        book = self.add_book(b'pdf')
+        StoredBlob.objects.all().delete()
+        self.assertEqual(recount(), 1)
+        self.assertEqual(StoredBlob.objects.get(
+            name=book.file.name).references, 1)
+
+    def test_immutable_cache_headers(self):
+        book = self.add_book(b'pdf')
+        request = RequestFactory().get('/media/' + book.file.name)
+        response = serve_immutable(request, book.file.name, self.media)
+        self.assertEqual(response['Cache-Control'],
+            settings.CAS_CACHE_CONTROL)
+
+
+class ImportCatalogTest(AccountTests):
+    __doc__ = """Bulk catalog import command."""
+
+    def write_feed(self, suffix, content):
+        feed = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        self.addCleanup(os.remove, feed.name)
+        with feed:
+            feed.write(content)
+        return feed.name
+
+    def test_import_csv(self):
+        path = self.write_feed('.csv', 'name,category,authors,description\n'
+            'Dune,category1,Frank Herbert|author1,Spice\n'
+            'Emma,Novel,Jane Austen,\n'
+            ',Novel,Nobody,missing name\n')
+        call_command('import_catalog', path, batch_size=1,
+            stdout=io.StringIO(), stderr=io.StringIO())
+
+        dune = BookCatalog.objects.get(name='Dune')
+        self.assertEqual(dune.category, self.category)
+        self.assertEqual(sorted(dune.author.values_list('name', flat=True)),
+            ['Frank Herbert', 'author1'])
+        self.assertEqual(Category.objects.filter(name='Novel').count(), 1)
+        self.assertEqual(reconcile(), {'BookCatalog': 0, 'Author': 0,
+            'Category': 0})
+
+        response = self.client.get(reverse('bookcatalog-search') + '?q=herbert',
+            format='json')
+        self.assertEqual([book['id'] for book in response.data['data']],
+            [dune.id])
+
+    def test_import_jsonl_resume(self):
+        path = self.write_feed('.jsonl', '\n'.join(json.dumps({
+            'name': 'book {0}'.format(number), 'category': 'Novel',
+            'authors': ['Jane Austen']}) for number in range(5)))
+        out = io.StringIO()
+        call_command('import_catalog', path, offset=3, batch_size=2,
+            stdout=out)
+        self.assertEqual(sorted(BookCatalog.objects.filter(
+            category__name='Novel').values_list('name', flat=True)),
+            ['book 3', 'book 4'])
+        self.assertIn('resume with --offset 5', out.getvalue())
+        self.assertEqual(AuthorStats.objects.get(
+            author__name='Jane Austen').book_count, 2)
+
+    def test_ids_of_deleted_rows_not_reused(self):
+        book = BookCatalog.objects.create(name='gone', category=self.category)
+        category = Category.objects.create(name='gone')
+        deleted = book.id, category.id
+        book.delete()
+        category.delete()
+        path = self.write_feed('.jsonl', json.dumps({'name': 'Emma',
+            'category': 'Novel', 'authors': ['Jane Austen']}))
+        call_command('import_catalog', path, stdout=io.StringIO())
+        self.assertGreater(BookCatalog.objects.get(name='Emma').id,
+            deleted[0])
+        self.assertGreater(Category.objects.get(name='Novel').id, deleted[1])
+
+
+class ExportTest(AccountTests):
+    __doc__ = """Streamed NDJSON and CSV exports."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookcatalog-export')
+        for number in range(2, 6):
+            book = BookCatalog.objects.create(
+                name='book{0}'.format(number), category=self.category)
+            book.author.add(self.author)
+        ReadersTracker.objects.create(
+            book=self.book, reader=self.user, percent=10)
+
+    def lines(self, response):
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_ndjson_in_chunks(self):
+        response = self.client.get(self.url)
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['name'] for row in rows],
+            ['book1', 'book2', 'book3', 'book4', 'book5'])
+        self.assertEqual(rows[0]['authors'], ['author1'])
+        self.assertEqual(rows[0]['category'], 'category1')
+
+        out = io.StringIO()
+        call_command('export_catalog', 'books', chunk_size=2, stdout=out)
+        self.assertEqual(
+            [json.loads(line)['id'] for line in out.getvalue().splitlines()],
+            [row['id'] for row in rows])
+
+    def test_export_csv_updated_range(self):
+        BookCatalog.objects.filter(name='book3').update(
+            updated=timezone.now() + timedelta(days=1))
+        after = (timezone.now() + timedelta(hours=1)).isoformat()
+        response = self.client.get(self.url, {'output': 'csv',
+            'updated_after': after})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.lines(response)
+        self.assertEqual(lines[0],
+            'id,name,category,authors,description,created,updated')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',book3,category1,author1,', lines[1])
+
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tracker_export_superuser_only(self):
+        url = reverse('readerstracker-export')
+        rows = [json.loads(line) for line in self.lines(self.client.get(url))]
+        self.assertEqual(rows[0]['percent'], 10)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite connection profile')
+# a DATABASE_PATH deployment, the test settings have no WAL
+@override_settings(SQLITE_PRAGMAS=dict(settings.SQLITE_PRAGMAS,
+    journal_mode='wal'))
+class SQLiteProfileTest(APITestCase):
+    __doc__ = """Pragmas and transactions of the library.sqlite3 backend."""
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA {0}'.format(name))
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self.pragma(connection, 'busy_timeout'),
+            settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma(connection, 'cache_size'),
+            settings.SQLITE_PRAGMAS['cache_size'])
+
+    def file_connection(self, directory):
+        wrapper = connection.copy()
+        wrapper.settings_dict['NAME'] = os.path.join(
+            directory, 'profile.sqlite3')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_file_database_in_wal_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.file_connection(directory)
+            self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+
+            # what atomic() does, the write lock is taken by BEGIN
+            wrapper.set_autocommit(False,
+                force_begin_transaction_with_broken_autocommit=True)
+            other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0)
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute('BEGIN IMMEDIATE')
+            other.close()
+            wrapper.rollback()
+            wrapper.close()
+
+    def test_transaction_mode_of_alias(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.file_connection(directory)
+            wrapper.settings_dict['TRANSACTION_MODE'] = 'DEFERRED'
+            wrapper.set_autocommit(False,
+                force_begin_transaction_with_broken_autocommit=True)
+            # nothing read or written yet, no lock is held
+            other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0)
+            other.execute('BEGIN IMMEDIATE')
+            other.rollback()
+            other.close()
+            wrapper.rollback()
+            wrapper.close()
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.file_connection(directory)
+            with wrapper.cursor() as cursor:
+                cursor.execute('CREATE TABLE pages (id integer)')
+                cursor.execute('INSERT INTO pages VALUES (1)')
+            output = io.StringIO()
+            with mock.patch('management.management.commands.'
+                    'sqlite_checkpoint.connection', wrapper):
+                call_command('sqlite_checkpoint', stdout=output)
+            wrapper.close()
+        self.assertRegex(output.getvalue(), r'^(\d+) of \1 WAL frames')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(APITestCase):
+    __doc__ = """Routing of reads to the replicas."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.token = 'Token {0}'.format(uuid.uuid4().hex)
+        # the sticky marker needs a cache every worker sees
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name}})
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+    def read_databases(self, method, models=(BookCatalog,), **extra):
+        """The aliases reads of `models` go to while the request runs."""
+        seen = []
+        middleware = ReplicaMiddleware(lambda request: seen.extend(
+            self.router.db_for_read(model) for model in models))
+        middleware(getattr(self.factory, method)('/api/bookcatalog/', **extra))
+        return seen
+
+    def read_database(self, method, **extra):
+        """The alias BookCatalog reads go to while the request runs."""
+        return self.read_databases(method, **extra)[0]
+
+    def test_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(BookCatalog), 'default')
+        self.assertEqual(self.router.db_for_write(BookCatalog), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'management'))
+
+    def test_safe_requests_read_from_replicas(self):
+        self.assertEqual(self.read_database('get'), 'replica1')
+        self.assertEqual(self.read_database('post'), 'default')
+        # the state does not leak past the request
+        self.assertEqual(self.router.db_for_read(BookCatalog), 'default')
+
+    def test_reads_stick_to_default_after_a_write(self):
+        self.assertEqual(self.read_database(
+            'get', HTTP_AUTHORIZATION=self.token), 'replica1')
+        self.read_database('post', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(self.read_database(
+            'get', HTTP_AUTHORIZATION=self.token), 'default')
+        self.assertEqual(self.read_database(
+            'get', HTTP_AUTHORIZATION='Token other'), 'replica1')
+
+    def test_accounts_read_from_default(self):
+        # a token made by login is looked up by the very next request
+        self.assertEqual(self.read_databases('get', models=(BookCatalog,
+            Token, User)), ['replica1', 'default', 'default'])
+
+    @override_settings(DATABASE_REPLICAS=['replica{0}'.format(number)
+        for number in range(1, 9)])
+    def test_one_replica_per_request(self):
+        for _ in range(5):
+            self.assertEqual(len(set(self.read_databases(
+                'get', models=[BookCatalog] * 10))), 1)
+
+    def test_shared_cache_entries_built_from_default(self):
+        seen = []
+
+        def build_response():
+            seen.append(self.router.db_for_read(BookCatalog))
+            return Response({})
+
+        def view(request):
+            seen.append(self.router.db_for_read(BookCatalog))
+            with primary_reads():
+                seen.append(self.router.db_for_read(BookCatalog))
+            mixin = CachedReadMixin()
+            mixin.get_cache_key = lambda request: uuid.uuid4().hex
+            mixin.cached_response(request, build_response)
+            seen.append(self.router.db_for_read(BookCatalog))
+
+        ReplicaMiddleware(view)(self.factory.get('/api/bookcatalog/'))
+        self.assertEqual(seen, ['replica1', 'default', 'default', 'replica1'])
+
+    def test_per_process_cache_reads_from_default(self):
+        with self.settings(CACHES={'default': {'BACKEND':
+                'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(self.read_database('get'), 'default')
+
+
+class BenchmarkTest(TransactionTestCase):
+    __doc__ = """The API benchmark on a tiny dataset. Committed data, the
+    client threads have connections of their own."""
+
+    def test_seed_and_run(self):
+        seed(books=30, authors=10, categories=3, readers=4, trackers=50,
+            reviews=10)
+        counts = dataset()
+        self.assertEqual(counts['bookcatalog'], 30)
+        self.assertEqual(counts['readerstracker'], 50)
+        self.assertFalse(any(reconcile().values()))
+
+        report = run(threads=1, requests=30, warmup=2)
+        self.assertEqual(report['overall']['requests'], 30)
+        self.assertEqual(report['overall']['errors'], 0)
+        for summary in report['endpoints'].values():
+            self.assertGreater(summary['queries_per_request'], 0)
+            self.assertLessEqual(summary['latency_ms']['p50'],
+                summary['latency_ms']['p99'])
@@ -0,0 +1,124 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+
+from django.conf import settings
+
+from rest_framework.exceptions import ValidationError
+
+from library.storage import cas_storage
+
+
+CHUNK_SIZE = 64 * 1024
+
+# running sha256 of the uploads written by this process, so completing
+# an upload does not read the file again
+_hashers = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+class OffsetMismatch(Exception):
+    pass
+
+
+def _lock(upload):
+    with _registry_lock:
+        return _locks.setdefault(upload.pk, threading.Lock())
+
+
+def _forget(upload):
+    with _registry_lock:
+        _hashers.pop(upload.pk, None)
+        _locks.pop(upload.pk, None)
+
+
+def partial_path(upload):
+    return os.path.join(settings.BOOK_UPLOAD_DIR,
+        '{0}.part'.format(upload.pk))
+
+
+def _hasher(upload):
+    """sha256 state of the first `upload.offset` bytes. Uploads resumed
+    on another process, or after a restart, hash the partial file once."""
+    offset, hasher = _hashers.get(upload.pk, (None, None))
+    if offset == upload.offset:
+        return hasher
+    hasher = hashlib.sha256()
+    if upload.offset:
+        with open(partial_path(upload), 'rb') as stream:
+            remaining = upload.offset
+            while remaining:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+
+def write_chunk(upload, offset, stream):
+    """Stream the request body to the partial file at `offset`, which has
+    to be where the upload stopped. Returns the new offset."""
+    with _lock(upload):
+        if offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+        hasher = _hasher(upload)
+
+        os.makedirs(settings.BOOK_UPLOAD_DIR, exist_ok=True)
+        path = partial_path(upload)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as output:
+            output.seek(offset)
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                offset += len(chunk)
+                if offset > upload.size:
+                    _hashers.pop(upload.pk, None)
+                    raise ValidationError(
+                        {'detail': 'Chunk goes past the upload size.'})
+                hasher.update(chunk)
+                output.write(chunk)
+            output.truncate()
+        _hashers[upload.pk] = (offset, hasher)
+    return offset
+
+
+def _move(source, target):
+    try:
+        os.replace(source, target)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        # another mount, copied next to the target first so the hashed
+        # name never shows a half written file
+        temporary = '{0}.part'.format(target)
+        shutil.move(source, temporary)
+        os.replace(temporary, target)
+
+
+def finish_upload(upload):
+    """Move the complete partial file into the content addressed storage,
+    renamed, not copied, or dropped if the storage has the content
+    already. Returns the storage name and the sha256 of the file."""
+    with _lock(upload):
+        digest = _hasher(upload).hexdigest()
+
+    name = cas_storage.hashed_name(
+        digest, os.path.splitext(upload.filename)[1])
+    if cas_storage.exists(name):
+        os.remove(partial_path(upload))
+    else:
+        target = cas_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _move(partial_path(upload), target)
+    _forget(upload)
+    return name, digest
+
+
+def discard_upload(upload):
+    _forget(upload)
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
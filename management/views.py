@@ -1,6 +1,14 @@
-from django.shortcuts import render
+import io
+
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 
 from rest_framework import status
+from rest_framework import mixins
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.decorators import action
@@ -8,53 +16,212 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import (SessionAuthentication,
     BasicAuthentication)
+from rest_framework.exceptions import ValidationError
 
 from .models import (Category, Author, BookCatalog,
-    Review, ReadersTracker)
-from .serializers import (GetBookCatalogSerializer,
-    PostBookCatalogSerializer, AuthorSerializer, ReviewSerializer, 
-    CategorySerializer, GetReadersTrackerSerializer,
-    PostReadersTrackerSerializer)
-from library.custom_permission import APIPermission
-from library.pagination import CustomResultsSetPagination
+    Review, ReadersTracker, BookUpload, BookStats)
+from .serializers import (BOOK_STATS_FIELDS, EXPANDABLE_BOOK_FIELDS,
+    requested_fieldset, GetBookCatalogSerializer,
+    PostBookCatalogSerializer, BookStatsSerializer, AuthorSerializer,
+    ReviewSerializer, CategorySerializer, GetReadersTrackerSerializer,
+    PostReadersTrackerSerializer, ProgressSerializer,
+    SyncProgressSerializer, LibraryEntrySerializer,
+    BookUploadSerializer)
+from library.custom_permission import APIPermission, SuperUserPermission
+from library.pagination import (CustomResultsSetPagination,
+    CursorResultsSetPagination)
+from .filters import BookCatalogFilter, book_facets, wants_facets
+from .mixins import CachedReadMixin, ConditionalGetMixin
+from .search import SearchResults, search_enabled
+from .progress import apply_progress, progress_buffer
+from .downloads import file_response
+from .exports import CONTENT_TYPES, export_lines
+from .tasks import generate_cover_thumbnails, has_uploaded_cover
+from .uploads import (OffsetMismatch, discard_upload, finish_upload,
+    write_chunk)
+
+
+def export_response(request, name):
+    """Streamed export, ?output=ndjson (default) or csv."""
+    output = request.query_params.get('output', 'ndjson')
+    lines = export_lines(name, output, request.query_params)
+    response = StreamingHttpResponse(lines,
+        content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(
+        name, output)
+    return response
+
+
+def latest_reviews():
+    """The BOOK_LATEST_REVIEWS newest reviews of every prefetched book,
+    served by the (book, -created) index."""
+    latest = Review.objects.filter(book_id=OuterRef('book_id')).order_by(
+        '-created', '-id').values('pk')[:settings.BOOK_LATEST_REVIEWS]
+    return Review.objects.filter(pk__in=Subquery(latest)).order_by(
+        '-created', '-id')
+
+
+def book_prefetches(names=EXPANDABLE_BOOK_FIELDS):
+    """Prefetches needed by GetBookCatalogSerializer, every nested
+    relation is loaded with a fixed number of queries whatever the page
+    size."""
+    prefetches = {
+        'author': Prefetch('author',
+            queryset=Author.objects.select_related('stats')),
+        'category': Prefetch('category',
+            queryset=Category.objects.select_related('stats')),
+        'reviews': Prefetch('reviews',
+            queryset=latest_reviews(), to_attr='latest_reviews'),
+    }
+    return [prefetches[name] for name in names]
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+def book_catalog_queryset(queryset, request=None):
+    """Query plan for GetBookCatalogSerializer. With a sparse fieldset
+    only the requested columns and relations are loaded."""
+    fieldset = requested_fieldset(request)
+    if fieldset is None:
+        return queryset.select_related('stats').prefetch_related(
+            *book_prefetches())
+
+    fields, expand = fieldset
+    wanted = [name for name in EXPANDABLE_BOOK_FIELDS
+        if not fields or name in fields]
+    prefetches = book_prefetches(
+        names=[name for name in wanted if name in expand])
+    if 'author' in wanted and 'author' not in expand:
+        prefetches.append(
+            Prefetch('author', queryset=Author.objects.only('id')))
+    if 'reviews' in wanted and 'reviews' not in expand:
+        prefetches.append(Prefetch('reviews',
+            queryset=latest_reviews().only('id', 'book'),
+            to_attr='latest_reviews'))
+    if not fields or set(fields) & set(BOOK_STATS_FIELDS):
+        queryset = queryset.select_related('stats')
+
+    columns = set(fields)
+    if 'cover_urls' in columns:
+        columns.update(('book_cover', 'thumbnail_source'))
+    deferred = [name for name in ('name', 'book_cover', 'thumbnail_source',
+        'description', 'file', 'created', 'updated')
+        if fields and name not in columns]
+    return queryset.defer(*deferred).prefetch_related(*prefetches)
+
+
+class CategoryViewSet(CachedReadMixin, viewsets.ModelViewSet):
     __doc__ = 'Category Views'
 
     permission_classes = (IsAuthenticated, APIPermission)
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
+
+    def get_queryset(self):
+        return self.queryset.select_related('stats')
     
     @action(detail=False, methods=['get'], name='Author Books', 
         url_path='books/(?P<pk>\d+)', url_name='books')
     def books(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = GetBookCatalogSerializer(
-            instance.books.all(), many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build_response():
+            instance = self.get_object()
+            books = book_catalog_queryset(instance.books.all(), request)
+            serializer = GetBookCatalogSerializer(
+                books, many=True, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.cached_response(request, build_response)
 
 # from rest_framework  import generics,status
 from rest_framework.parsers import FormParser,MultiPartParser
 
-class BookCatalogViewSet(viewsets.ModelViewSet):
+class BookCatalogViewSet(ConditionalGetMixin, CachedReadMixin,
+        viewsets.ModelViewSet):
     __doc__ = """Book Catalog Views"""
 
     permission_classes = (IsAuthenticated, APIPermission)
     serializer_class = GetBookCatalogSerializer
     pagination_class = CustomResultsSetPagination
+    filter_backends = (BookCatalogFilter, )
     queryset = BookCatalog.objects.all()
     parser_classes = (MultiPartParser, )
+    # default cursor ordering, the reviews action pages by `created`
+    ordering = '-id'
     
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def get_queryset(self):
+        return book_catalog_queryset(self.queryset, self.request)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        params = self.request.query_params
+        if self.action == 'list' and wants_facets(params):
+            response.data['meta']['facets'] = book_facets(
+                self.queryset.all(), params)
+        return response
+
+    @action(detail=False, methods=['get'], name='Search Books',
+        url_path='search', url_name='search')
+    def search(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+
+        def build_response():
+            queryset = self.get_queryset()
+            if search_enabled():
+                results = SearchResults(query, queryset)
+            else:
+                results = queryset.filter(name__icontains=query)
+            page = self.paginate_queryset(results)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return self.cached_response(request, build_response)
+
+    @action(detail=True, methods=['get'], name='Book Reviews',
+        url_path='reviews', url_name='reviews', ordering='-created')
+    def reviews(self, request, *args, **kwargs):
+        def build_response():
+            book = get_object_or_404(
+                BookCatalog.objects.only('id', 'name'), pk=kwargs['pk'])
+            reviews = Review.objects.filter(book=book).order_by(
+                '-created', '-id')
+            page = self.paginate_queryset(reviews)
+            for review in page:
+                review.book = book
+            serializer = ReviewSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return self.cached_response(request, build_response)
+
+    @action(detail=True, methods=['get'], name='Book Stats',
+        url_path='stats', url_name='stats')
+    def stats(self, request, *args, **kwargs):
+        """Current counters, not cached: every tracker change moves them."""
+        stats = BookStats.objects.filter(book_id=kwargs['pk']).first()
+        if stats is None:
+            stats = BookStats(book=get_object_or_404(
+                BookCatalog.objects.only('id'), pk=kwargs['pk']))
+        return Response(BookStatsSerializer(stats).data,
+            status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], name='Download Book',
+        url_path='download', url_name='download',
+        permission_classes=(IsAuthenticated,))
+    def download(self, request, *args, **kwargs):
+        book = get_object_or_404(
+            BookCatalog.objects.only('id', 'file'), pk=kwargs['pk'])
+        return file_response(request, book.file)
+
+    @action(detail=False, methods=['get'], name='Export Books',
+        url_path='export', url_name='export')
+    def export(self, request, *args, **kwargs):
+        return export_response(request, 'books')
+
     def create(self, request):
         serializer = PostBookCatalogSerializer(
             data=request.data,
             context={'request':request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        self.queue_thumbnails(serializer.save())
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
@@ -62,7 +229,7 @@ class BookCatalogViewSet(viewsets.ModelViewSet):
         serializer = PostBookCatalogSerializer(instance, request.data,
             context={'request':request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        self.queue_thumbnails(serializer.save())
         return Response(serializer.data)
 
     def partial_update(self, request, *args, **kwargs):
@@ -70,24 +237,36 @@ class BookCatalogViewSet(viewsets.ModelViewSet):
         serializer = PostBookCatalogSerializer(instance, request.data,
             context={'request':request}, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        self.queue_thumbnails(serializer.save())
         return Response(serializer.data)
 
+    def queue_thumbnails(self, book):
+        cover = book.book_cover.name
+        if has_uploaded_cover(cover) and book.thumbnail_source != cover:
+            transaction.on_commit(
+                lambda: generate_cover_thumbnails.delay(book.pk))
 
-class AuthorViewSet(viewsets.ModelViewSet):
+
+class AuthorViewSet(CachedReadMixin, viewsets.ModelViewSet):
     __doc__ = """Author Views"""
 
     permission_classes = (IsAuthenticated, APIPermission)
     serializer_class = AuthorSerializer
     queryset = Author.objects.all()
 
+    def get_queryset(self):
+        return self.queryset.select_related('stats')
+
     @action(detail=False, methods=['get'], name='Author Books',
         url_path='books/(?P<pk>\d+)', url_name='books')
     def books(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = GetBookCatalogSerializer(
-            instance.books.all(), many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build_response():
+            instance = self.get_object()
+            books = book_catalog_queryset(instance.books.all(), request)
+            serializer = GetBookCatalogSerializer(
+                books, many=True, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.cached_response(request, build_response)
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
@@ -111,6 +290,10 @@ class ReadersTrackerViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def get_queryset(self):
+        return self.queryset.prefetch_related(Prefetch('book',
+            queryset=book_catalog_queryset(BookCatalog.objects.all())))
+
     # def get_queryset(self):
     #     return ReadersTracker.objects.filter(reader=self.request.user)
 
@@ -128,4 +311,151 @@ class ReadersTrackerViewSet(viewsets.ModelViewSet):
             instance.percent = percent
             instance.save()
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+        permission_classes=(IsAuthenticated, SuperUserPermission))
+    def export(self, request):
+        return export_response(request, 'trackers')
+
+    @action(detail=False, methods=['post'])
+    def progress(self, request):
+        """Buffered progress of the current user, no query on this path:
+        the update is coalesced and written later with the others."""
+        serializer = ProgressSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        progress_buffer.add(request.user.pk,
+            serializer.validated_data['book'],
+            serializer.validated_data['percent'])
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """Replay of offline progress: a list of {book, percent,
+        client_timestamp} applied in one transaction, answered with the
+        status of every item in the order received. client_timestamp
+        dates the tracker, so my-library keeps the order of reading."""
+        if not isinstance(request.data, list):
+            raise ValidationError({'detail': 'Expected a list of items.'})
+        if len(request.data) > settings.PROGRESS_SYNC_LIMIT:
+            raise ValidationError({'detail': 'At most {0} items.'.format(
+                settings.PROGRESS_SYNC_LIMIT)})
+
+        items, updates, read_at = [], {}, {}
+        for data in request.data:
+            serializer = SyncProgressSerializer(data=data)
+            if not serializer.is_valid():
+                items.append((None, {'status': 'invalid',
+                    'errors': serializer.errors}))
+                continue
+            key = (request.user.pk, serializer.validated_data['book'])
+            updates[key] = max(serializer.validated_data['percent'],
+                updates.get(key, 0))
+            timestamp = serializer.validated_data.get('client_timestamp')
+            if timestamp and (key not in read_at or timestamp > read_at[key]):
+                read_at[key] = timestamp
+            items.append((key, serializer.data))
+
+        results = apply_progress(updates, read_at)
+        data = []
+        for key, item in items:
+            if key is not None:
+                item = dict(item, **results[key])
+                if item['status'] == 'invalid':
+                    item['errors'] = {'book': ['Unknown book.']}
+            data.append(item)
+        return Response({'data': data})
+
+
+class MyLibraryViewSet(viewsets.ReadOnlyModelViewSet):
+    __doc__ = """Books the current user is reading, most recently read
+    first, ?ordering=updated for the oldest first"""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = LibraryEntrySerializer
+    pagination_class = CustomResultsSetPagination
+    queryset = ReadersTracker.objects.all()
+    ordering = '-updated'
+
+    def get_queryset(self):
+        orderings = CursorResultsSetPagination.orderings
+        ordering = self.request.query_params.get('ordering')
+        if ordering not in orderings:
+            ordering = self.ordering
+        books = BookCatalog.objects.select_related('category').only(
+            'id', 'name', 'book_cover', 'thumbnail_source',
+            'category__name').prefetch_related(
+            Prefetch('author', queryset=Author.objects.only('id', 'name')))
+        return self.queryset.filter(reader=self.request.user).prefetch_related(
+            Prefetch('book', queryset=books)).order_by(*orderings[ordering])
+
+
+class BookUploadViewSet(mixins.CreateModelMixin,
+        mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+        viewsets.GenericViewSet):
+    __doc__ = """Resumable book file uploads: create the upload, PUT the
+    chunks in order with ?offset=, then complete it. A dropped upload
+    resumes from the offset returned by GET."""
+
+    permission_classes = (IsAuthenticated, APIPermission)
+    serializer_class = BookUploadSerializer
+    queryset = BookUpload.objects.all()
+
+    def get_queryset(self):
+        return self.queryset.filter(uploader=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(uploader=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+        instance.delete()
+
+    def get_incomplete_upload(self):
+        upload = self.get_object()
+        if upload.completed:
+            raise ValidationError({'detail': 'Upload already completed.'})
+        return upload
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, *args, **kwargs):
+        """Raw request body appended at ?offset=, streamed to disk."""
+        upload = self.get_incomplete_upload()
+        try:
+            offset = int(request.query_params['offset'])
+        except (KeyError, ValueError):
+            raise ValidationError({'offset': 'Expected the chunk offset.'})
+
+        try:
+            new_offset = write_chunk(
+                upload, offset, request.stream or io.BytesIO())
+        except OffsetMismatch:
+            return Response(self.get_serializer(upload).data,
+                status=status.HTTP_409_CONFLICT)
+        if not BookUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=new_offset, updated=timezone.now()):
+            upload.refresh_from_db()
+            return Response(self.get_serializer(upload).data,
+                status=status.HTTP_409_CONFLICT)
+        upload.offset = new_offset
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, *args, **kwargs):
+        upload = self.get_incomplete_upload()
+        if upload.offset != upload.size:
+            raise ValidationError({'offset': 'Upload is missing {0} bytes.'
+                .format(upload.size - upload.offset)})
+
+        # claimed first, a second complete of the same upload fails here;
+        # the claim is rolled back if the file cannot be moved
+        with transaction.atomic():
+            if not BookUpload.objects.filter(
+                    pk=upload.pk, completed=False).update(completed=True):
+                raise ValidationError({'detail': 'Upload already completed.'})
+            name, upload.sha256 = finish_upload(upload)
+            upload.completed = True
+            upload.save()
+            upload.book.file = name
+            upload.book.save()
+        return Response(self.get_serializer(upload).data)
@@ -0,0 +1,45 @@
+import copy
+
+from django.conf import settings
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from library.cache import TwoTierCache
+
+
+token_cache = TwoTierCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_LOCAL_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+    timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT,
+    cross_process=True)
+
+
+def _token_key(key):
+    return 'auth-token:{0}'.format(key)
+
+
+def forget_token(key):
+    """Drop a token from the cache, the next request looks it up again."""
+    token_cache.delete(_token_key(key))
+
+
+def forget_user_tokens(user):
+    for key in Token.objects.filter(user=user).values_list('key', flat=True):
+        forget_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    __doc__ = """TokenAuthentication that remembers the user of a token,
+    a cache hit costs no query. Entries are dropped when the token is
+    deleted or the user saved, other processes may keep theirs for
+    AUTH_TOKEN_CACHE_LOCAL_TTL seconds. The user is a snapshot, views
+    save it with update_fields so stale columns are not written back."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(_token_key(key))
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(_token_key(key), token)
+        # views may change request.user, the cached one stays as loaded
+        return copy.copy(token.user), token
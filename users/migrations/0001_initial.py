@@ -0,0 +1,25 @@
+# Generated by Django 2.2.5 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('to', models.EmailField(max_length=254)),
+                ('claim', models.CharField(blank=True, db_index=True, default='', max_length=32)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
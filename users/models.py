@@ -12,4 +12,19 @@ from django.db import models
 #         return '{0}'.format(self.username)
 
 #     class Meta(object):
-#         unique_together = ('email',)
\ No newline at end of file
+#         unique_together = ('email',)
+
+class QueuedMail(models.Model):
+    __doc__ = "Outgoing email waiting for the next batch"
+
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    to = models.EmailField()
+    # set by the sender that took the message, empty while waiting
+    claim = models.CharField(max_length=32, blank=True, default='',
+        db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.to, self.subject)
@@ -1,18 +1,40 @@
+import uuid
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from celery import shared_task
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
 from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
+from django.utils import timezone
 from django.contrib.sites.models import Site
+from rest_framework.authtoken.models import Token
 
-@shared_task
-def user_account_confirmation_mail(user=None):
-    user = get_object_or_404(User, pk=user)
-    site = Site.objects.get(name='development')
+from library.cache import LRUCache
+from .models import QueuedMail
+
+
+_sites = LRUCache(maxsize=1, ttl=300)
+DRAIN_SCHEDULED_KEY = 'users:mail-drain-scheduled'
+
+
+def mail_site():
+    """The Site of the links in emails, looked up every few minutes."""
+    site = _sites.get(settings.MAIL_SITE_NAME)
+    if site is None:
+        site = Site.objects.get(name=settings.MAIL_SITE_NAME)
+        _sites.set(settings.MAIL_SITE_NAME, site)
+    return site
+
+
+def account_confirmation_message(user):
     kwargs = {
         "uid": urlsafe_base64_encode(force_bytes(user.pk)),
         "token": default_token_generator.make_token(user)
@@ -21,37 +43,77 @@ def user_account_confirmation_mail(user=None):
     activation_url = reverse("activate_user_account",
         kwargs=kwargs)
     activate_url = "{0}{1}".format(
-        site.domain, activation_url)
+        mail_site().domain, activation_url)
 
     msg='Please click on the below link to activate your account\n'\
         +activate_url
+    return QueuedMail(subject='Account Confirmation', body=msg,
+        to=user.email)
 
-    send_mail(
-    'Account Confirmation',
-    msg,
-    settings.EMAIL_HOST_USER,
-    [user.email],
-    fail_silently=False,
-    )
 
-
-@shared_task
-def forget_password_mail(user=None):
-    user = get_object_or_404(User, pk=user)
+def password_reset_message(user):
     token, created = Token.objects.get_or_create(user=user)
 
-    site = Site.objects.get(name='development')
-
     reset_url = '/passwordreset/'
     reset_link = "{0}{1}{2}".format(
-        site.domain, reset_url, token.key)
+        mail_site().domain, reset_url, token.key)
     msg = 'Please click on the below link\
     to reset your account password\n'+reset_link
-    
-    send_mail(
-        'Password Reset',
-        msg,
-        settings.EMAIL_HOST_USER,
-        [user.email],
-        fail_silently=False,
-    )
\ No newline at end of file
+    return QueuedMail(subject='Password Reset', body=msg, to=user.email)
+
+
+def queue_mail(*messages):
+    """Store the messages, a send_queued_mail run picks them up once the
+    transaction commits. One run is scheduled per burst."""
+    QueuedMail.objects.bulk_create(messages)
+    transaction.on_commit(schedule_mail_delivery)
+
+
+def schedule_mail_delivery():
+    if cache.add(DRAIN_SCHEDULED_KEY, True, settings.MAIL_BATCH_DELAY):
+        send_queued_mail.apply_async(countdown=settings.MAIL_BATCH_DELAY)
+
+
+@shared_task(ignore_result=True)
+def send_queued_mail(batch_size=None):
+    """Send the queued messages, `batch_size` at a time over a single
+    connection each. Returns the number sent."""
+    batch_size = batch_size or settings.MAIL_BATCH_SIZE
+    sent = 0
+    while True:
+        now = timezone.now()
+        # unclaimed, or claimed by a sender that died before it finished
+        waiting = Q(claim='') | Q(claimed_at__lt=now - timedelta(
+            seconds=settings.MAIL_CLAIM_TIMEOUT))
+        ids = list(QueuedMail.objects.filter(waiting).order_by('id')
+            .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return sent
+
+        # another sender may claim some of them first
+        claim = uuid.uuid4().hex
+        QueuedMail.objects.filter(waiting, pk__in=ids).update(
+            claim=claim, claimed_at=now)
+        batch = QueuedMail.objects.filter(claim=claim)
+        messages = [EmailMessage(mail.subject, mail.body,
+            settings.EMAIL_HOST_USER, [mail.to]) for mail in batch]
+        try:
+            with get_connection() as connection:
+                connection.send_messages(messages)
+        except Exception:
+            batch.update(claim='', claimed_at=None)
+            raise
+        batch.delete()
+        sent += len(messages)
+
+
+@shared_task(ignore_result=True)
+def user_account_confirmation_mail(user=None):
+    user = get_object_or_404(User, pk=user)
+    queue_mail(account_confirmation_message(user))
+
+
+@shared_task(ignore_result=True)
+def forget_password_mail(user=None):
+    user = get_object_or_404(User, pk=user)
+    queue_mail(password_reset_message(user))
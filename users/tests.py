@@ -1,4 +1,5 @@
 import tempfile
+from unittest import mock
 from PIL import Image
 from datetime import datetime, timedelta, date, time
 from faker import Faker
@@ -9,19 +10,32 @@ from django.urls import reverse
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.core.mail import get_connection
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APITestCase
 from rest_framework.test import RequestsClient
 
 from management.models import (Category, Author, BookCatalog,
     Review, ReadersTracker)
+from users.authentication import CachedTokenAuthentication, token_cache
+from users.models import QueuedMail
+from users.tasks import (_sites, account_confirmation_message,
+    forget_password_mail, password_reset_message, queue_mail,
+    send_queued_mail, user_account_confirmation_mail)
 
 fake = Faker()
 
 
-class AccountTests(APITestCase):
-    __doc__ = """Token authentication test case."""
+class AccountTestCase(APITestCase):
+    __doc__ = """An admin and a user, logged in. No tests of its own, the
+    subclasses would run them again."""
 
     token = None
 
@@ -57,6 +71,9 @@ class AccountTests(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_token)
 
 
+class AccountTests(AccountTestCase):
+    __doc__ = """Token authentication test case."""
+
     def test_user_login(self):
         __doc__ = "Testing token based authentication."
         
@@ -71,4 +88,126 @@ class AccountTests(APITestCase):
         url = '/api/login-user/'
         data = {'email_or_username': self.email, 'password': fake.password()}
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueuedMailTests(AccountTestCase):
+    __doc__ = """Batched email delivery."""
+
+    def setUp(self):
+        super().setUp()
+        _sites.clear()
+        Site.objects.create(name='development', domain='http://testserver')
+
+    def test_signup_queues_confirmation(self):
+        data = {'username': 'reader', 'email': 'reader@test.com',
+            'password': 'password123'}
+        # the task runs in the request thread instead of a worker
+        with mock.patch.object(user_account_confirmation_mail, 'delay',
+                side_effect=user_account_confirmation_mail):
+            response = self.client.post('/api/create-user/', data,
+                format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        queued = QueuedMail.objects.get()
+        self.assertEqual(queued.to, 'reader@test.com')
+        self.assertIn('http://testserver/api/activate/', queued.body)
+
+    def test_mail_built_by_the_worker(self):
+        # what the task fails on does not fail the request
+        Site.objects.all().delete()
+        _sites.clear()
+        with mock.patch.object(forget_password_mail, 'delay') as delay:
+            response = self.client.post('/api/forget-password/',
+                {'email': self.email}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        delay.assert_called_once_with(user=self.user.id)
+        self.assertFalse(QueuedMail.objects.exists())
+
+    def test_stale_claims_sent_again(self):
+        queue_mail(account_confirmation_message(self.user),
+            password_reset_message(self.admin))
+        stale, busy = QueuedMail.objects.order_by('id')
+        # a sender died holding `stale`, another is still sending `busy`
+        QueuedMail.objects.filter(pk=stale.pk).update(claim='dead',
+            claimed_at=timezone.now() - timedelta(
+                seconds=settings.MAIL_CLAIM_TIMEOUT + 1))
+        QueuedMail.objects.filter(pk=busy.pk).update(claim='busy',
+            claimed_at=timezone.now())
+        self.assertEqual(send_queued_mail(), 1)
+        self.assertEqual([message.to for message in mail.outbox],
+            [[self.email]])
+        self.assertEqual(list(QueuedMail.objects.values_list(
+            'claim', flat=True)), ['busy'])
+
+    def test_batches_share_a_connection(self):
+        with CaptureQueriesContext(connection) as queries:
+            queue_mail(*[account_confirmation_message(user)
+                for user in (self.user, self.admin)])
+        # the Site is looked up once for both messages
+        self.assertEqual(len(queries), 2)
+        queue_mail(password_reset_message(self.user))
+
+        with mock.patch('users.tasks.get_connection',
+                wraps=get_connection) as connections:
+            self.assertEqual(send_queued_mail(batch_size=2), 3)
+        self.assertEqual(connections.call_count, 2)
+        self.assertEqual([message.to for message in mail.outbox],
+            [[self.email], [self.admin_email], [self.email]])
+        self.assertIn('Password Reset', mail.outbox[2].subject)
+        self.assertFalse(QueuedMail.objects.exists())
+
+
+class CachedTokenAuthenticationTests(AccountTestCase):
+    __doc__ = """Token lookups served from the cache."""
+
+    def authenticate(self, key):
+        return CachedTokenAuthentication().authenticate_credentials(key)
+
+    def test_cache_hit_costs_no_query(self):
+        self.authenticate(self.token)
+        with CaptureQueriesContext(connection) as queries:
+            user, token = self.authenticate(self.token)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token)
+
+        # each request gets its own copy
+        user.first_name = 'changed'
+        self.assertEqual(self.authenticate(self.token)[0].first_name, '')
+
+    def test_logout_forgets_token(self):
+        self.authenticate(self.admin_token)
+        response = self.client.post('/api/logout/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.admin_token)
+
+    def test_password_change_forgets_token(self):
+        self.authenticate(self.admin_token)
+        response = self.client.post('/api/update-password/', {
+            'current_password': self.password,
+            'new_password': 'another password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            user, token = self.authenticate(self.admin_token)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(user.check_password('another password'))
+
+    def test_password_change_keeps_other_columns(self):
+        self.authenticate(self.admin_token)
+        # a change the cached copy of the user has not seen
+        User.objects.filter(pk=self.admin.pk).update(first_name='fresh')
+        response = self.client.post('/api/update-password/', {
+            'current_password': self.password,
+            'new_password': 'another password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.get(pk=self.admin.pk).first_name,
+            'fresh')
+
+    def test_per_process_backend_skips_shared_tier(self):
+        # the test runner configures LocMemCache
+        with mock.patch.object(token_cache.local, 'set'):
+            self.authenticate(self.token)
+            with CaptureQueriesContext(connection) as queries:
+                self.authenticate(self.token)
+        self.assertEqual(len(queries), 1)
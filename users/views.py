@@ -17,11 +17,12 @@ from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import (SessionAuthentication,
-    BasicAuthentication, TokenAuthentication)
+    BasicAuthentication)
 
+from .authentication import CachedTokenAuthentication
 from .serializers import UserSerializer, AuthCustomTokenSerializer
 from users.tasks import (user_account_confirmation_mail,
-    forget_password_mail)
+    forget_password_mail, mail_site)
 
 
 
@@ -106,8 +107,7 @@ def activate_user_account(request, uid=None, token=None):
         user.is_active = True
         user.save()
 
-        site = Site.objects.get(name='development')
-        url = '{0}{1}'.format(site.domain, '/accountconfirmation/')
+        url = '{0}{1}'.format(mail_site().domain, '/accountconfirmation/')
         return redirect(url)
 
     else:
@@ -141,7 +141,7 @@ class CustomAuthToken(ObtainAuthToken):
 class UserLogout(APIView):
     __doc__ = 'Uesr logout'
 
-    authentication_classes = [TokenAuthentication,]
+    authentication_classes = [CachedTokenAuthentication,]
     permission_classes = (IsAuthenticated,)
 
     def post(self, request):
@@ -154,7 +154,7 @@ class UserLogout(APIView):
 class UpdatePassword(APIView):
     __doc__ = 'Change/update user password.'
 
-    authentication_classes = [TokenAuthentication,]
+    authentication_classes = [CachedTokenAuthentication,]
     permission_classes = (IsAuthenticated,)
 
     def post(self, request):
@@ -165,7 +165,8 @@ class UpdatePassword(APIView):
         
         if checked:
             user.set_password(new_password)
-            user.save()
+            # request.user may come from the token cache
+            user.save(update_fields=['password'])
 
             return Response(data={
                 'result':True,
@@ -223,7 +224,7 @@ class ForgetPassword(APIView):
 
 
 class ResetPassword(APIView):
-    authentication_classes = [TokenAuthentication,]
+    authentication_classes = [CachedTokenAuthentication,]
     permissions_classes = (IsAuthenticated,)
 
     def post(self, request):
@@ -239,7 +240,7 @@ class ResetPassword(APIView):
         user = self.request.user
 
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password'])
 
         return Response(data={
             'result':True,